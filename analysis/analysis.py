@@ -18,6 +18,8 @@ It runs with scapy through the file and stores all DNS results in files.
 Afterwards it starts path measurements from a remote node to the targets of all network connections.
 The path measuremetns can get executed in application and in parallel.
 Before executing the path measurements a filter with IPs or Ports can get applied
+In online mode the .dump file is analysed while it is still written
+and the path measurements start as soon as a new connection appears.
 '''
 import ConfigParser
 import subprocess
@@ -26,6 +28,19 @@ import scapy
 from scapy.all import *
 from scapy.layers import *
 import time
+import multiprocessing
+import pcap_reader
+import fast_decoder
+import path_measurement
+import scheduler
+import path_cache
+import coalescing
+import blacklist
+import index_db
+import extractors
+import domain_map
+import hop_store
+import geo_lookup
 
 def get_time():
     '''
@@ -45,9 +60,373 @@ def get_date():
         month = str(localtime[1])
     return str(localtime[0]) + '_' + month + '_' + str(localtime[2])
 
-def analyze(directory, capture, country, hostname, application, counter):
+def get_option(config, section, option, default):
+    '''
+    returns an option of the config file or the default value if the option is missing
+    '''
+    if config.has_option(section, option):
+        return config.get(section, option, 0)
+    return default
+
+def stream_packets(filename, follow=None, prefilter=None):
+    '''
+    Generator, dissects one record of the .dump file after another with scapy.
+    In contrast to sniff(offline=...) only one packet is held in memory at a time.
+    If the function follow is given, the capture is followed while it grows (see pcap_reader).
+    Records the pre-filter skips (see blacklist.PreFilter) are not dissected.
+    '''
+    capture = pcap_reader.open_capture(filename, follow)
+    layer = conf.l2types.get(capture.linktype, Raw)
+    try:
+        for timestamp, wirelen, data in capture.records(follow):
+            if prefilter is not None and prefilter.skip(capture.linktype, timestamp, wirelen, data):
+                continue
+            packet = layer(data)
+            packet.time = timestamp
+            packet.wirelen = wirelen
+            yield packet
+    finally:
+        capture.close()
+
+def decode_range(job):
+    '''
+    Decodes the records of a capture that start in the byte range [start, end) with scapy,
+    executed in a worker process. end is None for the last range.
+    returns the extractors of the range and the offset the decoding stopped at
+    '''
+    filename, start, end, enabled, context = job
+    active = extractors.create(enabled, context)
+    prefilter = blacklist.PreFilter(context['blacklist'], context['ipaddress'],
+                                    active['flows'].flow_table)
+    capture = pcap_reader.PcapFile(filename)
+    layer = conf.l2types.get(capture.linktype, Raw)
+    capture.seek(start)
+    def packets():
+        '''
+        Generator, dissects the records of the range that are not skipped by the pre-filter
+        '''
+        for timestamp, wirelen, data in capture.records(end=end):
+            if prefilter.skip(capture.linktype, timestamp, wirelen, data):
+                continue
+            packet = layer(data)
+            packet.time = timestamp
+            packet.wirelen = wirelen
+            yield packet
+    try:
+        extractors.extract(packets(), active)
+        position = capture.tell()
+    finally:
+        capture.close()
+    return active, position
+
+def decode_parallel(filename, active, enabled, context, processes, min_chunk):
+    '''
+    Splits the capture at record boundaries into ranges of at least min_chunk bytes
+    and decodes them with a pool of processes.
+    The extractors of the ranges are merged into the active extractors in the order of the ranges,
+    therefore the result is the same as the one of a sequential run.
+    returns False if the capture has to be decoded sequentially
+    '''
+    if multiprocessing.current_process().daemon:
+        #Processes of a pool, e.g. of reprocess.py, can not start an own pool
+        return False
+    for extractor in active.values():
+        if not extractor.parallel:
+            print('The extractor ' + extractor.name + ' can not be merged, '
+                  'the capture is decoded sequentially')
+            return False
+    parts = min(processes * 4, int(os.path.getsize(filename) // min_chunk))
+    if parts < 2:
+        return False
+    boundaries = pcap_reader.split(filename, parts)
+    if len(boundaries) < 3:
+        return False
+    #The DNS answers of the previous ranges are only known when the ranges are merged
+    context = dict(context)
+    context['domains'] = domain_map.DomainMap()
+    #The memory-mapped geo databases are only used for the output
+    context['geo'] = None
+    jobs = []
+    i = 0
+    while i < len(boundaries) - 1:
+        jobs = jobs + [(filename, boundaries[i], boundaries[i+1], enabled, context)]
+        i = i+1
+    #The last range is read until the end of the file, it may end with a truncated record
+    jobs[-1] = (filename, boundaries[-2], None, enabled, context)
+
+    results = []
+    pool = multiprocessing.Pool(processes)
+    try:
+        for job, result in zip(jobs, pool.imap(decode_range, jobs)):
+            partial, position = result
+            if job[2] is not None and position != job[2]:
+                #The range did not end at the next boundary, the split was wrong
+                print('The capture can not be split at ' + str(job[2]) +
+                      ', it is decoded sequentially')
+                return False
+            results = results + [partial]
+    finally:
+        pool.terminate()
+        pool.join()
+    for partial in results:
+        for name, extractor in active.items():
+            extractor.merge(partial[name])
+            extractor.seconds = extractor.seconds + partial[name].seconds
+            extractor.packets = extractor.packets + partial[name].packets
+    return True
+
+class PathMeasurements():
+    '''
+    The path measurements of one capture.
+    The targets are added one after another with add() and coalesced according to the configured
+    policy, only one path measurement is made for each group of triples.
+    Normally the path measurements are executed by run() after the capture was analysed.
+    In online mode they are handed to the scheduler as soon as they are added
+    and poll() has to be called regularly while the capture is still analysed.
+    With measure=False no path measurements are made, the results of an earlier analysis
+    are taken from its path map, e.g. if stored captures are analysed again.
+    '''
+    def __init__(self, config, hostname, prefix, online=False, measure=True):
+        self.config = config
+        self.measure = measure
+        self.method = config.get('general', 'method', 0)
+        self.username = config.get('general', 'username', 0)
+        self.pkey = config.get('general', 'pkey', 0)
+        self.hostname = hostname
+        self.prefix = prefix
+        self.online = online
+        self.parallel = 'True' == config.get('general', 'parallel', 0)
+        if 'True' == config.get('general', 'in_application', 0):
+            self.in_application = (config.get('in_application', 'port_option', 0),
+                                   config.get('in_application', 'tcp_option', 0),
+                                   config.get('in_application', 'udp_option', 0))
+        else:
+            self.in_application = None
+
+        self.coalescer = coalescing.Coalescer(
+            get_option(config, 'coalescing', 'policy', 'triple'),
+            get_option(config, 'coalescing', 'prefix_length', '24'),
+            get_option(config, 'coalescing', 'prefix_length_v6', '48'))
+        #maps the measured triples to their result files
+        self.results = {}
+        self.serial = []
+        self.batch = []
+        self.batch_mode = get_option(config, 'batch', 'enabled', 'False') == 'True' and not online
+        self.pool = None
+        '''
+        The results are parsed into hop records as soon as they arrive (see hop_store.py).
+        '''
+        self.hops = None
+        if get_option(config, 'hops', 'enabled', 'False') == 'True':
+            if hop_store.available():
+                self.hops = hop_store.HopStore(os.path.basename(prefix),
+                                               geo_lookup.from_config(config))
+            else:
+                print('NumPy is not available, the hops are not stored')
+        if not measure:
+            return
+
+        '''
+        One multiplexed SSH connection is opened to the remote node,
+        all path measurements are executed as channels on this connection.
+        '''
+        multiplexing = get_option(config, 'general', 'ssh_multiplexing', 'True') == 'True'
+        self.pool = path_measurement.SSHPool(multiplexing)
+        self.connection = self.pool.get(self.username, hostname, self.pkey)
+
+        '''
+        Results of earlier path measurements from the same remote node to the same target
+        are reused from the cache until their time to live expired.
+        Without in application measurements the protocol and port do not matter.
+        By default the cache is in the directory path_cache of the storage directory.
+        '''
+        self.cache = None
+        if get_option(config, 'cache', 'enabled', 'False') == 'True':
+            cache_directory = get_option(config, 'cache', 'directory', '').strip()
+            if cache_directory == '':
+                cache_directory = os.path.join(os.path.dirname(os.path.abspath(prefix)), os.pardir,
+                                               'path_cache')
+            self.cache = path_cache.PathCache(os.path.normpath(cache_directory),
+                                              get_option(config, 'cache', 'ttl', '86400'),
+                                              get_option(config, 'cache', 'max_entries', '10000'),
+                                              get_option(config, 'cache', 'eviction', 'lru'))
+
+        '''
+        The scheduler limits the number of probes running at the same time on the remote node
+        and the rate new probes are started with.
+        Without parallel path measurements, online mode runs one probe after another.
+        '''
+        max_concurrent = get_option(config, 'scheduler', 'max_concurrent', '8')
+        if not self.parallel:
+            max_concurrent = 1
+        self.probes = scheduler.Scheduler(max_concurrent,
+                                          get_option(config, 'scheduler', 'rate', '4'),
+                                          get_option(config, 'scheduler', 'burst', '8'),
+                                          self.store_result)
+
+    def cache_key(self, triple):
+        '''
+        returns the triple the cache entry of a path measurement is stored for
+        '''
+        if self.in_application is None:
+            return ('ANY', triple[1], 0)
+        return triple
+
+    def store_result(self, probe):
+        '''
+        Called by the scheduler for each finished path measurement
+        '''
+        if self.cache is not None and probe.returncode == 0:
+            self.cache.store(probe.node, self.cache_key(probe.data), probe.filename)
+        if self.hops is not None:
+            self.hops.add(probe.data, probe.filename)
+
+    def parse_results(self):
+        '''
+        Parses the results that were not measured by this analysis into hop records,
+        i.e. cached results and the results of an earlier analysis
+        '''
+        if self.hops is None:
+            return
+        directory = os.path.dirname(self.prefix)
+        for triple, name in self.results.items():
+            self.hops.add(triple, os.path.join(directory, name))
+
+    def result_file(self, triple, label='_traceroute'):
+        '''
+        returns the result file of the path measurement to a triple and remembers it for the map.
+        If the result is cached, None is returned.
+        '''
+        timestamp = get_date() + '_' + get_time()
+        filename = self.prefix + path_measurement.result_name(triple, self.in_application,
+                                                              timestamp, label)
+        self.results[triple] = os.path.basename(filename)
+        if self.cache is not None and self.cache.lookup(self.hostname, self.cache_key(triple),
+                                                        filename):
+            return None
+        return filename
+
+    def add(self, triple):
+        '''
+        Adds the target of a flow, a path measurement is made if it starts a new group
+        '''
+        alt = self.coalescer.add(triple)
+        if alt is None or not self.measure:
+            return
+        if not self.parallel and not self.online:
+            #The filename contains the time the path measurement is started
+            self.serial = self.serial + [alt]
+            return
+        filename = self.result_file(alt)
+        if filename is None:
+            return
+        if self.batch_mode:
+            remote_command, tty = path_measurement.probe(self.method, alt, self.in_application,
+                                                         False)
+            self.batch = self.batch + [scheduler.Probe(self.hostname, remote_command, filename, alt)]
+        else:
+            remote_command, tty = path_measurement.probe(self.method, alt, self.in_application)
+            self.probes.submit(scheduler.Probe(self.hostname,
+                                               self.connection.command(remote_command, tty),
+                                               filename, alt))
+            if self.online:
+                self.probes.poll()
+
+    def poll(self):
+        '''
+        Starts and collects the path measurements of the online mode
+        '''
+        if self.measure:
+            self.probes.poll()
+
+    def run(self):
+        '''
+        Executes the path measurements that are not done yet and writes the path map
+        '''
+        if not self.measure:
+            self.results = coalescing.read_map(self.prefix + '_path_map.txt')
+            self.parse_results()
+            return
+        if self.batch_mode:
+            '''
+            In batch mode all probes are sent at once to a runner on the remote node.
+            It executes them in parallel and streams the results back.
+            '''
+            session = path_measurement.BatchSession(
+                self.connection,
+                get_option(self.config, 'batch', 'parallelism', '8'),
+                get_option(self.config, 'batch', 'remote_python', 'python'),
+                get_option(self.config, 'batch', 'local', 'False') == 'True')
+            missing = session.run(self.batch, self.store_result)
+            if len(missing) > 0:
+                '''
+                Probes without result, e.g. because the connection or the runner broke,
+                are executed again one by one over the master connection.
+                '''
+                print('WARNING: ' + str(len(missing)) + ' path measurements of the batch on ' +
+                      self.hostname + ' returned no result, they are executed again')
+                for probe in missing:
+                    remote_command, tty = path_measurement.probe(self.method, probe.data,
+                                                                 self.in_application)
+                    self.probes.submit(scheduler.Probe(self.hostname,
+                                                       self.connection.command(remote_command, tty),
+                                                       probe.filename, probe.data))
+                self.probes.run()
+                lost = [probe for probe in missing if not os.path.exists(probe.filename)]
+                if len(lost) > 0:
+                    print('WARNING: ' + str(len(lost)) + ' path measurements have no result file,'
+                          ' they are left out of the path map')
+                    for probe in lost:
+                        del self.results[probe.data]
+        else:
+            '''
+            The probes share the master connection.
+            The output of each probe is written to its file as soon as the probe finished.
+            '''
+            self.probes.run()
+
+        '''
+        If the path measurements can not be executed parallel, they are started with
+        subprocess.check_output.
+        This time, the function waits actively for every output and stores it directly in
+        the according file.
+        '''
+        for alt in self.serial:
+            filename = self.result_file(alt, '')
+            if filename is None:
+                continue
+            remote_command, tty = path_measurement.probe(self.method, alt, self.in_application)
+            #exectuing the command
+            out = subprocess.check_output(self.connection.command(remote_command, tty), shell=True)
+            #writing the results in a file
+            f = open(filename, 'w')
+            f.write(out)
+            f.close()
+            if self.cache is not None:
+                self.cache.store(self.hostname, self.cache_key(alt), filename)
+            if self.hops is not None:
+                self.hops.add(alt, filename)
+
+        coalescing.write_map(self.prefix + '_path_map.txt', self.coalescer.groups, self.results)
+        self.parse_results()
+        if self.cache is not None:
+            print(self.cache.statistics())
+
+    def close(self):
+        '''
+        Closes the SSH connections
+        '''
+        if self.pool is not None:
+            self.pool.close()
+
+def analyze(directory, capture, country, hostname, application, counter, follow=False,
+            paths=True):
     '''
     Funtion, analysing the .dump file.
+    With follow=True the .dump file is analysed while tcpdump is still writing it (online mode),
+    the path measurements start as soon as a new flow appears.
+    The capture is complete as soon as the file capture + '.done' exists.
+    With paths=False no path measurements are made and the existing path map is kept.
     '''
     direc = os.path.dirname(__file__)
     if direc != '':
@@ -55,8 +434,6 @@ def analyze(directory, capture, country, hostname, application, counter):
     config = ConfigParser.ConfigParser()
     config.read(direc+'analysis.ini')
 
-    method = config.get('general', 'method', 0)
-    options = config.get('general', 'options', 0)
     '''
     If a network commection was established from the Internet to the devices in the framework,
     the path measurement has to be made to the source address and source port.
@@ -64,230 +441,185 @@ def analyze(directory, capture, country, hostname, application, counter):
     '''
     ipaddress = config.get('general', 'ip_address', 0)
     identifier = config.get('general', 'identifier', 0)
-    ip_blacklist = config.get('general', 'ip_blacklist', 0).split(', ')
-    port_blacklist = config.get('general', 'port_blacklist', 0).split(', ')
-    username = config.get('general', 'username', 0)
-    pkey = config.get('general', 'pkey', 0)
-    
-
-    if 'True' == config.get('general', 'parallel', 0):
-        parallel = True
-    else:
-        parallel = False
-    if 'True' == config.get('general', 'in_application', 0):
-        inapplication = True
-    else:
-        inapplication = False
-    if inapplication:
-        port_option = config.get('in_application', 'port_option', 0)
-        tcp_option = config.get('in_application', 'tcp_option', 0)
-        udp_option = config.get('in_application', 'udp_option', 0)
-
-    #Opens the .dump file with scapy
-    packets = sniff(offline=directory+capture)
-
-    dns_host_list_of_answer = []
-    prot_ip_port = []
+    '''
+    The blacklist holds IPs, networks in CIDR notation, ports and port ranges.
+    Packets of blacklisted connections are counted in the flow table without dissecting them
+    and are no targets for path measurements.
+    '''
+    ip_port_blacklist = blacklist.Blacklist(config.get('general', 'ip_blacklist', 0),
+                                            config.get('general', 'port_blacklist', 0))
 
-    for p in packets:
-        '''
-        To make in application path measurement, a triple for each network connection is necessary:
-        1. used protocol: TCP or UDP
-        2. IP address
-        3. Port number
-        '''
-        if p.haslayer(UDP):
-            if p.haslayer(DNS):
-                '''
-                DNS resolutions are not considered for the path measurements.
-                The DNS responses are directly stored in extra files.
-                The requested hostname is the filename and the resulting IPs the content of the file
-                '''
-                if p[DNS].qr == 1:
-                    i = 0
-                    f = open(directory + counter + '_' + identifier + '_' + application + '_' +
-                             country + '_' + hostname + '_DNS_' + p[DNS].qd.qname, 'a')
-                    while i < p[DNS].ancount:
-                        f.write(str(p[DNS].an[i].rdata)+'\n')
-                        i = i+1
-                    f.close()
-            else:
-                #The IP address of the framework device is no target for path measurements
-                if p[IP].src == ipaddress:
-                    #Only differing triples are stored
-                    if p[IP].dst not in ip_blacklist and str(p[UDP].dport) not in port_blacklist:
-                        help = ('UDP', p[IP].dst, p[UDP].dport)
-                        if help not in prot_ip_port:
-                            print(help)
-                            prot_ip_port = prot_ip_port +[help]
-                else:
-                    #Only differing triples are stored
-                    if p[IP].src not in ip_blacklist and str(p[UDP].sport) not in port_blacklist:
-                        help = ('UDP', p[IP].src, p[UDP].sport)
-                        if help not in prot_ip_port:
-                            print(help)
-                            prot_ip_port = prot_ip_port +[help]
-        elif p.haslayer(TCP):
-            #The same for TCP as for UDP
-            if p[IP].src == ipaddress:
-                if p[IP].dst not in ip_blacklist and p[TCP].dport not in port_blacklist:
-                    help = ('TCP', p[IP].dst, p[TCP].dport)
-                    if help not in prot_ip_port:
-                        prot_ip_port = prot_ip_port +[help]
-            else:
-                if p[IP].src not in ip_blacklist and p[TCP].sport not in port_blacklist:
-                    help = ('TCP', p[IP].src, p[TCP].sport)
-                    if help not in prot_ip_port:
-                        prot_ip_port = prot_ip_port +[help]
+    prefix = directory + counter + '_' + identifier + '_' + application + '_'
+    prefix = prefix + country + '_' + hostname
+    excluded = ip_port_blacklist.blocked
+    '''
+    Every packet is dissected once and handed to all extractors (see extractors.py):
+    the flow table, the DNS answers and the enabled additional extractors.
+    '''
+    enabled = get_option(config, 'extractors', 'enabled', '')
+    '''
+    The IPs of the DNS answers are mapped to the requested hostnames to label the flows.
+    The map is shared by all applications of one experiment (same counter) in the storage directory.
+    '''
+    domains = domain_map.DomainMap()
+    domains_file = None
+    if get_option(config, 'domains', 'persistent', 'True') == 'True':
+        domains_file = os.path.join(directory, os.pardir,
+                                    counter + '_' + identifier + '_ip_domain_map.json')
+        domains.load(domains_file)
+    '''
+    The flows and the hops are enriched with the ASN and the country of the IPs (see geo_lookup.py).
+    '''
+    geo = geo_lookup.from_config(config)
+    context = {'config': config, 'prefix': prefix, 'ipaddress': ipaddress,
+               'blacklist': ip_port_blacklist, 'domains': domains, 'geo': geo}
+    active = extractors.create(enabled, context)
+    flow_table = active['flows'].flow_table
+    dns_answers = active['dns'].dns_answers
 
-    traces = []
-    filenames = []
     '''
     Command is the path measurement that is executed on a remote node:
     For example:
-    echo "sudo traceroute -U -p 23 1.2.3.4; exit" | ssh -i ~/.ssh/rsa_key user@hostname
-
-    echo "sudo traceroute -T -p 443 1.2.3.4; exit" | ssh -tt -i ~/.ssh/rsa_key user@hostname
+    echo "sudo traceroute -U -p 23 1.2.3.4; exit" | ssh -S /tmp/matador-ssh-x/0123 -i ~/.ssh/rsa_key
+                                                         user@hostname
 
-    TCP traceroutes require root rights. Some SSH configurations don't allow
-    fowarding commands as root wothout a Shell.
-    '-tt' requests a pseudo terminal.
-    Tests showed only even numbers of '-t' works.
+    echo "sudo traceroute -T -p 443 1.2.3.4; exit" | ssh -tt -S /tmp/matador-ssh-x/0123
+                                                         -i ~/.ssh/rsa_key user@hostname
 
     Filename is the file were to store the result of the path measurement with the directory.
     For example:
     /home/result/whatsapp/0001_2_whatsapp_DE_example.tum.de_traceroute_to_1.2.3.4_port_443
                _proto_TCP_at_01.02.3456_16:25:12.txt
     '''
+    measurements = PathMeasurements(config, hostname, prefix, follow, paths)
+    try:
+        decoder = get_option(config, 'general', 'decoder', 'scapy')
+        if decoder == 'fast' and not fast_decoder.available():
+            print('NumPy is not available, the scapy decoder is used')
+            decoder = 'scapy'
 
-    if parallel:
-        '''
-        If the path measurements can be executed in parallel, they are started with subprocess.Popen
-        and the handler 'process' is stored in a list and the according filename in another.
-        Sometimes plenty of path measurements have to be executed in parallel, to not open to many
-        SSH connections in to short time, a 1s timeout is waited before each.
-        At the end, the function waits for every process to terminate
-        and stores the output in the according file.
-        '''
-        for alt in prot_ip_port:
-            timestamp = get_date() + '_' + get_time()
-            if inapplication:
-                if alt[0] == 'UDP':
-                    #Concatenating the command
-                    command = 'echo "sudo ' + method + ' ' + udp_option + ' ' + port_option + ' '
-                    command = command + str(alt[2])+ ' ' + str(alt[1]) + ' ; exit" | ssh -i '
-                    command = command + pkey + ' ' +username + '@' + hostname
-                    time.sleep(1)
-                    #exectuing the command
-                    process = subprocess.Popen(command,
-                                               shell=True,
-                                               stdout=subprocess.PIPE,
-                                               stderr=subprocess.PIPE)
-                    #concatenating the filename
-                    filename = '_traceroute_to_'+str(alt[1])+'_port_' + str(alt[2])+'_proto_UDP_at_'
-                    filename = filename +timestamp+'.txt'
-                    #adding the handler and the filename to the according list
-                    traces = traces + [process]
-                    filenames = filenames + [filename]
-
-                else:
-                    #Concatenating the command
-                    command = 'echo "sudo ' + method + ' ' + tcp_option + ' ' + port_option + ' '
-                    command = command + str(alt[2])+ ' ' + str(alt[1]) + ' ; exit" | ssh -tt -i '
-                    command = command + pkey + ' ' +username+'@'+hostname
-                    time.sleep(1)
-                    #exectuing the command
-                    process = subprocess.Popen(command,
-                                               shell=True,
-                                               stdout=subprocess.PIPE,
-                                               stderr=subprocess.PIPE)
-                    #concatenating the filename
-                    filename = '_traceroute_to_'+str(alt[1])+'_port_' + str(alt[2])+'_proto_TCP_at_'
-                    filename = filename + timestamp+'.txt'
-                    #adding the handler and the filename to the according list
-                    traces = traces + [process]
-                    filenames = filenames + [filename]
-            else:
-                #Concatenating the command
-                command = 'echo "sudo ' + method + ' ' + str(alt[1]) + ' ; exit" | ssh -i ' + pkey
-                command = command + ' ' +username+'@'+hostname
-                time.sleep(1)
-                #exectuing the command
-                process = subprocess.Popen(command,
-                                           shell=True,
-                                           stdout=subprocess.PIPE,
-                                           stderr=subprocess.PIPE)
-                #concatenating the filename
-                filename = '_traceroute_to_'+str(alt[1])+ '_at_'+timestamp+'.txt'
-                #adding the handler and the filename to the according list
-                traces = traces + [process]
-                filenames = filenames + [filename]
-
-        for trace in traces:
+        if follow:
             '''
-            Waiting actively for each process to finish.
-            Writing the results to files afterwards.
+            The growing .dump file is streamed packet by packet,
+            the fast decoder needs the complete file.
+            If no done marker appears, the analysis stops after idle_timeout seconds without new data.
             '''
-            out, err = trace.communicate()
-            filename = directory + counter + '_' + identifier + '_' + application + '_' + country
-            filename = filename +  '_' + hostname + filenames.pop(0)
-            f = open(filename, 'w')
-            f.write(out)
-            f.close()
+            marker = directory + capture + '.done'
+            idle_timeout = float(get_option(config, 'online', 'idle_timeout', '600'))
+            state = {'size': -1, 'changed': time.time()}
+            def growing():
+                '''
+                Called while waiting for new packets, returns True as long as the capture grows
+                '''
+                measurements.poll()
+                if os.path.exists(marker):
+                    return False
+                size = -1
+                if os.path.exists(directory + capture):
+                    size = os.path.getsize(directory + capture)
+                if size != state['size']:
+                    state['size'] = size
+                    state['changed'] = time.time()
+                elif time.time() - state['changed'] > idle_timeout:
+                    print('The capture did not grow for ' + str(idle_timeout) + ' seconds')
+                    return False
+                return True
+            def new_flow(triple):
+                '''
+                The path measurement of a new flow starts immediately
+                '''
+                if not excluded(triple):
+                    measurements.add(triple)
+            active['flows'].new_flow = new_flow
+            prefilter = blacklist.PreFilter(ip_port_blacklist, ipaddress, flow_table)
+            seconds = extractors.extract(stream_packets(directory+capture, growing, prefilter),
+                                         active)
+            if os.path.exists(marker):
+                os.remove(marker)
+        elif decoder == 'fast':
+            '''
+            The fast decoder extracts the header fields of all packets at once.
+            Only the DNS responses are dissected with scapy.
+            '''
+            started = time.time()
+            decoded = fast_decoder.DecodedCapture(directory+capture)
+            for extractor in list(active.values()):
+                extractor_started = time.time()
+                if not extractor.decoded(decoded):
+                    print('The extractor ' + extractor.name + ' needs the scapy decoder')
+                    del active[extractor.name]
+                extractor.seconds = time.time() - extractor_started
+            decoded.close()
+            seconds = time.time() - started
+        else:
+            '''
+            The .dump file is either streamed packet by packet (default)
+            or loaded completely into memory with sniff.
+            '''
+            reader = get_option(config, 'general', 'reader', 'stream')
+            processes = int(get_option(config, 'decoding', 'processes', '1'))
+            if processes == 0:
+                processes = multiprocessing.cpu_count()
+            started = time.time()
+            decoded = False
+            if reader == 'stream' and processes > 1:
+                '''
+                Large captures are split into byte ranges that are decoded in parallel.
+                '''
+                min_chunk = float(get_option(config, 'decoding', 'min_chunk', '16')) * 1048576
+                decoded = decode_parallel(directory+capture, active, enabled, context,
+                                          processes, min_chunk)
+            if not decoded:
+                if reader == 'sniff':
+                    packets = sniff(offline=directory+capture)
+                else:
+                    packets = stream_packets(directory+capture, None,
+                                             blacklist.PreFilter(ip_port_blacklist, ipaddress,
+                                                                 flow_table))
+                extractors.extract(packets, active)
+            seconds = time.time() - started
+        print(extractors.timing(active, seconds))
 
-    else:
         '''
-        If the path measurements can not be executed parallel, they are started with
-        subprocess.check_output.
-        This time, the function waits actively for every output and stores it directly in
-        the according file.
+        Each extractor writes its output, e.g. the flow summary with all flows and their statistics.
+        Only differing triples that pass the IP and port filter are targets for path measurements.
         '''
-        for alt in prot_ip_port:
-            timestamp = get_date() + '_' + get_time()
-            if inapplication:
-                if alt[0] == 'UDP':
-                    #Concatenating the command
-                    command = 'echo "sudo  ' + method + ' ' + udp_option + ' ' + port_option + ' '
-                    command = command + str(alt[2])+ ' ' + str(alt[1]) + ' ; exit" | ssh -i '
-                    command = command + pkey + ' ' +username+'@'+hostname
-                    #exectuing the command
-                    out = subprocess.check_output(command, shell=True)
-                    #concatenating the filename
-                    filename = directory + counter + '_' + identifier + '_' + application + '_'
-                    filename = filename + country + '_' + hostname +'_to_'+str(alt[1])+'_port_'
-                    filename = filename + str(alt[2]) + '_proto_UDP_at_' + timestamp + '.txt'
-                    #writing the results in a file
-                    f = open(filename, 'w')
-                    f.write(out)
-                    f.close()
-                else:
-                    #Concatenating the command
-                    command = 'echo "sudo ' + method + ' ' + tcp_option + ' ' + port_option + ' '
-                    command = command + str(alt[2]) + ' ' + str(alt[1]) + ' ; exit" | ssh -tt  -i '
-                    command = command + pkey + ' ' + username + '@' + hostname
-                    #exectuing the command
-                    out = subprocess.check_output(command, shell=True)
-                    #concatenating the filename
-                    filename = directory +counter + '_' + identifier + '_' + application + '_'
-                    filename = filename + country + '_' + hostname + '_to_'+str(alt[1])+'_port_'
-                    filename = filename + str(alt[2]) + '_proto_TCP_at_' + timestamp + '.txt'
-                    #writing the results in a file
-                    f = open(filename, 'w')
-                    f.write(out)
-                    f.close()
-            else:
-                #Concatenating the command
-                command = 'echo "sudo ' + method + ' ' + str(alt[1]) + ' ; exit" | ssh -i '
-                command = command + pkey + ' ' +username+'@'+hostname
-                #exectuing the command
-                out = subprocess.check_output(command, shell=True)
-                #concatenating the filename
-                filename = directory +counter + '_' + identifier + '_' + application + '_' + country
-                filename = filename + '_'+hostname + '_to_' + str(alt[1]) +'_at_'+ timestamp +'.txt'
-                #writing the results in a file
-                f = open(filename, 'w')
-                f.write(out)
-                f.close()
+        for extractor in active.values():
+            extractor.finish()
+        if domains_file is not None:
+            domains.save(domains_file)
+
+        if not follow:
+            for triple in flow_table.triples():
+                if not excluded(triple):
+                    measurements.add(triple)
+        measurements.run()
+        if measurements.hops is not None:
+            measurements.hops.save(os.path.join(directory, os.pardir,
+                                                counter + '_' + identifier + '_hops.npz'))
+        if geo is not None:
+            print(geo.statistics())
+    finally:
+        measurements.close()
+
+    '''
+    The flows, DNS answers and hops of the path measurements are inserted into the index database
+    of all experiments in one transaction. By default the database is in the storage directory.
+    '''
+    if get_option(config, 'index', 'enabled', 'False') == 'True':
+        database = get_option(config, 'index', 'database', '')
+        if database == '':
+            database = os.path.join(directory, os.pardir, 'index.sqlite')
+        groups = measurements.coalescer.groups
+        index = index_db.IndexDatabase(database)
+        try:
+            index.insert(index_db.capture_row(counter, identifier, application, country, hostname,
+                                              capture),
+                         index_db.flow_rows(flow_table, excluded, groups, measurements.results),
+                         index_db.dns_rows(dns_answers),
+                         index_db.hop_rows(directory, groups, measurements.results))
+        finally:
+            index.close()
 
 def main():
     '''
@@ -298,6 +630,7 @@ def main():
     4. The hostname of the remote node
     5. The name of the measured smartphone application
     6. The actual counter to store the results unique
+    The optional 7th parameter 'follow' analyses the .dump file while it is still written.
     '''
     if len(sys.argv) < 7:
         #Test if the programm gets executed with to less parameters
@@ -317,7 +650,8 @@ def main():
     hostname = sys.argv[4]
     application = sys.argv[5]
     counter = sys.argv[6]
-    analyze(directory, capture, country, hostname, application, counter)
+    follow = len(sys.argv) > 7 and sys.argv[7] == 'follow'
+    analyze(directory, capture, country, hostname, application, counter, follow)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,115 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Client of the resident analysis service (analysis_daemon.py).
+It takes the same parameters as analysis.py, hands the job to the service
+and returns when the analysis has finished, with exit code 1 if it failed.
+If the service is not running, analysis.py is executed directly.
+If the connection is lost after the job was handed over, the analysis counts as failed.
+"python analysis_client.py stats" prints the queue depth and the job latencies of the service.
+Only the Python standard library is used, it runs with Python 2 and 3.
+'''
+import errno
+import json
+import os
+import socket
+import subprocess
+import sys
+try:
+    import configparser
+except ImportError:
+    import ConfigParser as configparser
+
+def connect(path):
+    '''
+    returns a socket connected to the service
+    '''
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except socket.error:
+        client.close()
+        raise
+    return client
+
+def request(client, message):
+    '''
+    Sends one request over the connected socket and returns the response of the service
+    '''
+    try:
+        client.sendall((json.dumps(message) + '\n').encode('utf-8'))
+        response = client.makefile('rb').readline()
+    finally:
+        client.close()
+    if not response:
+        raise socket.error('the analysis daemon closed the connection')
+    return json.loads(response.decode('utf-8'))
+
+def main():
+    '''
+    The script needs the 6 parameters of analysis.py (and optionally 'follow') or 'stats'
+    '''
+    direc = os.path.dirname(os.path.abspath(__file__))
+    config = configparser.ConfigParser()
+    config.read(os.path.join(direc, 'analysis.ini'))
+    path = '/tmp/matador-analysis.sock'
+    python = 'python'
+    if config.has_option('daemon', 'socket'):
+        path = config.get('daemon', 'socket')
+    if config.has_option('daemon', 'python'):
+        python = config.get('daemon', 'python')
+
+    arguments = sys.argv[1:]
+    if arguments == ['stats']:
+        print(json.dumps(request(connect(path), {'command': 'stats'}), indent=1, sort_keys=True))
+        return
+    if len(arguments) < 6:
+        print('''
+              The script needs the 6 parameters of analysis.py:
+              1. A directory where the .dump file is located and where to store the results afterwards.
+              2. The name of the .dump file.
+              3. The country code of the remote node
+              4. The hostname of the remote node
+              5. The name of the measured smartphone application
+              6. The actual counter to store the results unique
+              or 'stats' to print the statistics of the analysis daemon
+              ''')
+        sys.exit(1)
+    #The daemon has another working directory
+    arguments[0] = os.path.abspath(arguments[0])
+    #Only if the daemon is not reachable analysis.py is executed directly,
+    #a job that was handed over must not run twice
+    try:
+        client = connect(path)
+    except socket.error as error:
+        if error.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+            print('The analysis daemon could not be reached: ' + str(error))
+            sys.exit(1)
+        print('The analysis daemon is not running, analysis.py is executed directly')
+        sys.exit(subprocess.call([python, os.path.join(direc, 'analysis.py')] + arguments))
+    try:
+        response = request(client, {'command': 'analyze', 'arguments': arguments})
+    except (socket.error, ValueError) as error:
+        print('The analysis of ' + arguments[1] + ' failed, the connection to the analysis daemon '
+              'was lost: ' + str(error))
+        sys.exit(1)
+    if response.get('status') != 'ok':
+        print('The analysis of ' + arguments[1] + ' failed: ' + json.dumps(response))
+        sys.exit(1)
+    print('Analysed ' + arguments[1] + ' in %.1f s after waiting %.1f s' %
+          (response['seconds'], response['wait']))
+
+if __name__ == '__main__':
+    main()
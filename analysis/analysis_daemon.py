@@ -0,0 +1,227 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Resident analysis service.
+Importing scapy takes several seconds on the routers, the service imports it once
+and accepts analysis jobs over a local Unix socket (analysis_client.py).
+The jobs are queued and executed by a number of workers, each job runs in a forked process
+that inherits the loaded modules, therefore a failing analysis does not stop the service.
+A request is one JSON object per line, the response is sent when the job has finished:
+{"command": "analyze", "arguments": [directory, capture, country, hostname, application, counter]}
+{"command": "stats"} returns the queue depth and the latencies of the last jobs.
+'''
+import ConfigParser
+import collections
+import json
+import multiprocessing
+import os
+import Queue
+import signal
+import socket
+import SocketServer
+import sys
+import threading
+import time
+import analysis
+import geo_lookup
+
+#Number of finished jobs the latency statistics are computed from
+HISTORY = 1000
+
+class Job():
+    '''
+    An analysis job with the arguments of analysis.py and its timestamps
+    '''
+    def __init__(self, arguments):
+        self.arguments = arguments
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.exitcode = None
+        self.done = threading.Event()
+
+def run(arguments):
+    '''
+    Executes one analysis in the forked process of a job
+    '''
+    directory, capture, country, hostname, application, counter = arguments[:6]
+    follow = len(arguments) > 6 and arguments[6] == 'follow'
+    analysis.analyze(directory, capture, country, hostname, application, counter, follow)
+
+class AnalysisService():
+    '''
+    Queue of analysis jobs that are executed by a number of worker threads.
+    '''
+    def __init__(self, workers):
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.history = collections.deque(maxlen=HISTORY)
+        self.workers = [threading.Thread(target=self.work) for i in range(max(int(workers), 1))]
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+
+    def submit(self, arguments):
+        '''
+        returns the queued job and the number of jobs waiting before it
+        '''
+        job = Job(arguments)
+        depth = self.queue.qsize()
+        self.queue.put(job)
+        return job, depth
+
+    def work(self):
+        '''
+        Worker thread, executes one job after another in a forked process
+        '''
+        while True:
+            job = self.queue.get()
+            self.lock.acquire()
+            self.running = self.running + 1
+            self.lock.release()
+            job.started = time.time()
+            process = multiprocessing.Process(target=run, args=(job.arguments,))
+            process.start()
+            process.join()
+            job.exitcode = process.exitcode
+            job.finished = time.time()
+            self.lock.acquire()
+            self.running = self.running - 1
+            self.completed = self.completed + 1
+            if job.exitcode != 0:
+                self.failed = self.failed + 1
+            self.history.append((job.started - job.submitted, job.finished - job.started))
+            self.lock.release()
+            print('%s %s: exit code %d, waited %.1f s, analysed in %.1f s' %
+                  (time.strftime('%H:%M:%S'), job.arguments[1], job.exitcode,
+                   job.started - job.submitted, job.finished - job.started))
+            sys.stdout.flush()
+            job.done.set()
+
+    def statistics(self):
+        '''
+        returns the queue depth, the job counters and the latencies of the last jobs in seconds
+        '''
+        self.lock.acquire()
+        history = list(self.history)
+        result = {'queued': self.queue.qsize(), 'running': self.running,
+                  'completed': self.completed, 'failed': self.failed}
+        self.lock.release()
+        for index, name in [(0, 'wait'), (1, 'analysis')]:
+            values = sorted([entry[index] for entry in history])
+            if values:
+                result[name] = {'mean': sum(values) / len(values),
+                                'median': values[len(values) // 2],
+                                'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+                                'max': values[-1]}
+        return result
+
+class Handler(SocketServer.StreamRequestHandler):
+    '''
+    Handles one request of a client
+    '''
+    def reply(self, response):
+        self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+    def handle(self):
+        service = self.server.service
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+        except ValueError:
+            self.reply({'status': 'error', 'error': 'the request is no JSON object'})
+            return
+        command = request.get('command')
+        if command == 'stats':
+            self.reply(service.statistics())
+        elif command == 'analyze':
+            arguments = [str(argument) for argument in request.get('arguments', [])]
+            if len(arguments) < 6:
+                self.reply({'status': 'error', 'error': 'analyze needs 6 arguments'})
+                return
+            if not os.path.isabs(arguments[0]):
+                #A relative directory would be resolved in the working directory of the daemon
+                self.reply({'status': 'error', 'error': 'the directory has to be absolute'})
+                return
+            job, depth = service.submit(arguments)
+            job.done.wait()
+            status = 'ok'
+            if job.exitcode != 0:
+                status = 'failed'
+            self.reply({'status': status, 'exitcode': job.exitcode, 'queue': depth,
+                        'wait': job.started - job.submitted,
+                        'seconds': job.finished - job.started})
+        else:
+            self.reply({'status': 'error', 'error': 'unknown command ' + str(command)})
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    '''
+    Unix socket server with one thread per connection
+    '''
+    daemon_threads = True
+
+def running(path):
+    '''
+    returns True if a service is listening on the socket
+    '''
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except socket.error:
+        return False
+    finally:
+        client.close()
+    return True
+
+def terminate(signum, frame):
+    '''
+    Stops the service on SIGTERM
+    '''
+    raise SystemExit(0)
+
+def main():
+    '''
+    The socket and the number of workers are configured in the daemon section of the analysis.ini
+    '''
+    direc = os.path.dirname(os.path.abspath(__file__))
+    config = ConfigParser.ConfigParser()
+    config.read(os.path.join(direc, 'analysis.ini'))
+    path = analysis.get_option(config, 'daemon', 'socket', '/tmp/matador-analysis.sock')
+    workers = analysis.get_option(config, 'daemon', 'workers', '2')
+
+    if os.path.exists(path):
+        if running(path):
+            print('The analysis daemon is already running on ' + path)
+            sys.exit(1)
+        os.remove(path)
+    #The geo databases are mapped before the jobs are forked, the jobs inherit them
+    geo_lookup.from_config(config)
+    server = Server(path, Handler)
+    server.service = AnalysisService(workers)
+    signal.signal(signal.SIGTERM, terminate)
+    print('Analysis daemon listening on ' + path + ' with ' + str(workers) + ' workers')
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Benchmark for the readers of the analysis module.
+The script writes synthetic .dump files with a growing number of packets
+and reads each of them in a fresh interpreter with the different reader modes:
+1. records: the plain pcap_reader generator without dissection
+2. stream: the streaming scapy reader of the analysis module
+3. sniff: scapy's sniff(offline=...) which loads the whole capture
+
+The peak resident set size of each interpreter is printed afterwards.
+It stays flat for the streaming modes and grows with the capture for sniff.
+The scapy modes need the same Python version as the analysis module.
+'''
+import os
+import resource
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ['records', 'stream', 'sniff']
+
+def write_capture(filename, packets):
+    '''
+    Writes a pcap file with the given number of Ethernet/IPv4/UDP packets.
+    '''
+    payload = b'x' * 200
+    f = open(filename, 'wb')
+    f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+    i = 0
+    while i < packets:
+        udp = struct.pack('!HHHH', 40000, 3478, 8 + len(payload), 0) + payload
+        ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0, 64, 17, 0,
+                         b'\x0a\x00\x00\x0a', struct.pack('!I', 0x1f0d0000 + i % 65536))
+        frame = b'\x00\x00\x00\x00\x00\x02\x00\x00\x00\x00\x00\x01\x08\x00' + ip + udp
+        f.write(struct.pack('<IIII', 1000 + i // 1000, i % 1000, len(frame), len(frame)))
+        f.write(frame)
+        i = i+1
+    f.close()
+
+def child(mode, filename):
+    '''
+    Reads the capture with the given mode and prints the peak RSS in kB and the runtime.
+    '''
+    start = time.time()
+    count = 0
+    if mode == 'records':
+        import pcap_reader
+        for record in pcap_reader.read_records(filename):
+            count = count+1
+    else:
+        import analysis
+        if mode == 'stream':
+            packets = analysis.stream_packets(filename)
+        else:
+            packets = analysis.sniff(offline=filename)
+        for p in packets:
+            count = count+1
+    duration = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(str(peak) + ' ' + str(count) + ' ' + str(duration))
+
+def main():
+    '''
+    The script takes an optional list of packet counts as parameters.
+    '''
+    if len(sys.argv) > 3 and sys.argv[1] == '--child':
+        child(sys.argv[2], sys.argv[3])
+        return
+
+    sizes = [int(size) for size in sys.argv[1:]]
+    if len(sizes) == 0:
+        sizes = [10000, 50000, 200000]
+
+    direc = os.path.dirname(os.path.abspath(__file__))
+    tmpdir = tempfile.mkdtemp()
+    print('mode     packets       MB   peak RSS kB   seconds')
+    for size in sizes:
+        filename = os.path.join(tmpdir, 'benchmark_' + str(size) + '.dump')
+        write_capture(filename, size)
+        megabytes = os.path.getsize(filename) / 1000000.0
+        for mode in MODES:
+            command = [sys.executable, os.path.join(direc, 'benchmark_reader.py'),
+                       '--child', mode, filename]
+            process = subprocess.Popen(command, cwd=direc,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+            out, err = process.communicate()
+            if process.returncode != 0:
+                #e.g. scapy is not available for this interpreter
+                print('%-8s %7d %8.1f   %11s' % (mode, size, megabytes, 'n/a'))
+                continue
+            peak, count, duration = out.decode('utf-8').split()[-3:]
+            print('%-8s %7d %8.1f   %11s   %7.2f' % (mode, size, megabytes, peak,
+                                                     float(duration)))
+        os.remove(filename)
+    os.rmdir(tmpdir)
+
+if __name__ == '__main__':
+    main()
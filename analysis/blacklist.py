@@ -0,0 +1,235 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Compiled IP and port blacklist.
+The ip_blacklist and port_blacklist of the analysis.ini are compiled once:
+IPs and networks in CIDR notation (IPv4 and IPv6) into a binary prefix trie,
+ports and port ranges (e.g. 6881-6889) into a bitmap of all 65536 ports.
+The pre-filter reads the addresses and ports directly from the bytes of a record,
+packets of blacklisted connections are only counted in the flow table and never dissected.
+'''
+import socket
+import struct
+import fast_decoder
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = 0x8100
+
+class BlacklistException(Exception):
+    '''
+    Exception if an entry of the blacklist is no valid IP, network or port
+    '''
+    def __init__(self, value):
+        self.value = value
+    def __str__(self):
+        return repr(self.value)
+
+def entries(value):
+    '''
+    returns the entries of a blacklist option, separated by commas and/or spaces
+    '''
+    return [entry for entry in value.replace(',', ' ').split() if entry != '']
+
+def pack(ip):
+    '''
+    returns the packed bytes of an IPv4 or IPv6 address
+    '''
+    if ':' in ip:
+        return socket.inet_pton(socket.AF_INET6, ip)
+    return socket.inet_pton(socket.AF_INET, ip)
+
+class PrefixTrie():
+    '''
+    Binary trie of network prefixes, one root for IPv4 and one for IPv6.
+    A node is a list [child for bit 0, child for bit 1, True if a prefix ends here].
+    '''
+    def __init__(self):
+        self.roots = {4: [None, None, False], 16: [None, None, False]}
+        self.cache = {}
+
+    def add(self, network):
+        '''
+        adds an IP or a network in CIDR notation, e.g. 31.13.0.0/16
+        '''
+        if '/' in network:
+            ip, length = network.split('/', 1)
+        else:
+            ip, length = network, None
+        try:
+            packed = bytearray(pack(ip))
+            if length is None:
+                length = 8 * len(packed)
+            length = int(length)
+        except (socket.error, ValueError):
+            raise BlacklistException(network + ' is no valid IP or network')
+        if length < 0 or length > 8 * len(packed):
+            raise BlacklistException(network + ' has an invalid prefix length')
+        node = self.roots[len(packed)]
+        i = 0
+        while i < length:
+            bit = (packed[i // 8] >> (7 - i % 8)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, False]
+            node = node[bit]
+            i = i+1
+        node[2] = True
+        self.cache = {}
+
+    def contains(self, ip):
+        '''
+        returns True if the IP is in one of the networks, the results are cached per IP
+        '''
+        result = self.cache.get(ip)
+        if result is not None:
+            return result
+        try:
+            packed = bytearray(pack(ip))
+        except (socket.error, ValueError):
+            return False
+        node = self.roots[len(packed)]
+        result = node[2]
+        i = 0
+        while not result and i < 8 * len(packed):
+            node = node[(packed[i // 8] >> (7 - i % 8)) & 1]
+            if node is None:
+                break
+            result = node[2]
+            i = i+1
+        self.cache[ip] = result
+        return result
+
+def transport(linktype, data):
+    '''
+    returns (protocol, source IP, source port, destination IP, destination port) of a TCP or UDP packet
+    read from the raw bytes of a record or None if it is no such packet or can not be read
+    '''
+    if linktype not in fast_decoder.LINK_TYPES:
+        return None
+    ethertype_offset, offset = fast_decoder.LINK_TYPES[linktype]
+    length = len(data)
+    if ethertype_offset is not None:
+        if length < offset:
+            return None
+        ethertype = struct.unpack_from('!H', data, ethertype_offset)[0]
+        if ethertype == ETHERTYPE_VLAN and length >= offset + 4:
+            ethertype = struct.unpack_from('!H', data, offset + 2)[0]
+            offset = offset + 4
+    elif length > offset:
+        ethertype = {4: ETHERTYPE_IPV4, 6: ETHERTYPE_IPV6}.get(bytearray(data[offset:offset+1])[0] >> 4)
+    else:
+        return None
+    if ethertype == ETHERTYPE_IPV4:
+        if length < offset + 20:
+            return None
+        version_ihl, flags_fragment, proto = struct.unpack_from('!B5xH1xB', data, offset)
+        if version_ihl >> 4 != 4 or version_ihl & 15 < 5 or flags_fragment & 0x1fff != 0:
+            return None
+        src = socket.inet_ntoa(data[offset+12:offset+16])
+        dst = socket.inet_ntoa(data[offset+16:offset+20])
+        offset = offset + 4 * (version_ihl & 15)
+    elif ethertype == ETHERTYPE_IPV6:
+        if length < offset + 40:
+            return None
+        proto = bytearray(data[offset+6:offset+7])[0]
+        src = socket.inet_ntop(socket.AF_INET6, data[offset+8:offset+24])
+        dst = socket.inet_ntop(socket.AF_INET6, data[offset+24:offset+40])
+        offset = offset + 40
+    else:
+        return None
+    if proto == 6 and length >= offset + 20:
+        protocol = 'TCP'
+    elif proto == 17 and length >= offset + 8:
+        protocol = 'UDP'
+    else:
+        return None
+    sport, dport = struct.unpack_from('!HH', data, offset)
+    return (protocol, src, sport, dst, dport)
+
+class Blacklist():
+    '''
+    The compiled IP and port blacklist.
+    '''
+    def __init__(self, ip_blacklist, port_blacklist):
+        self.networks = PrefixTrie()
+        for entry in entries(ip_blacklist):
+            self.networks.add(entry)
+        self.ports = bytearray(8192)
+        for entry in entries(port_blacklist):
+            try:
+                if '-' in entry:
+                    first, last = [int(port) for port in entry.split('-', 1)]
+                else:
+                    first = last = int(entry)
+            except ValueError:
+                raise BlacklistException(entry + ' is no valid port or port range')
+            if first < 0 or last > 65535 or first > last:
+                raise BlacklistException(entry + ' is no valid port or port range')
+            port = first
+            while port <= last:
+                self.ports[port >> 3] = self.ports[port >> 3] | (1 << (port & 7))
+                port = port+1
+
+    def port_blocked(self, port):
+        '''
+        returns True if the port is blacklisted
+        '''
+        port = int(port)
+        return (self.ports[port >> 3] >> (port & 7)) & 1 == 1
+
+    def blocked(self, triple):
+        '''
+        returns True if the IP or the port of a triple (protocol, IP, port) is blacklisted
+        '''
+        return self.port_blocked(triple[2]) or self.networks.contains(triple[1])
+
+class PreFilter():
+    '''
+    Decides on the raw bytes of a record if a packet needs to be dissected.
+    Packets of blacklisted connections are added to the flow table directly.
+    DNS packets are always dissected, the DNS answers are collected independent of the blacklist.
+    '''
+    def __init__(self, blacklist, ipaddress, flow_table):
+        self.blacklist = blacklist
+        self.ipaddress = ipaddress
+        self.flow_table = flow_table
+        self.skipped = 0
+
+    def triple(self, linktype, data):
+        '''
+        returns the triple of the remote side of a TCP or UDP packet read from its headers
+        or None if the packet has to be dissected
+        '''
+        headers = transport(linktype, data)
+        if headers is None:
+            return None
+        protocol, src, sport, dst, dport = headers
+        if protocol == 'UDP' and (sport in fast_decoder.DNS_PORTS or dport in fast_decoder.DNS_PORTS):
+            return None
+        if src == self.ipaddress:
+            return (protocol, dst, dport)
+        return (protocol, src, sport)
+
+    def skip(self, linktype, timestamp, wirelen, data):
+        '''
+        returns True if the packet belongs to a blacklisted connection and was counted,
+        it does not need to be dissected
+        '''
+        triple = self.triple(linktype, data)
+        if triple is None or not self.blacklist.blocked(triple):
+            return False
+        self.flow_table.add(triple, wirelen or len(data), timestamp)
+        self.skipped = self.skipped + 1
+        return True
@@ -0,0 +1,127 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Coalescing of path measurement targets.
+Many flows go to the same server on several ports or to many addresses in the same network.
+The triples are grouped according to a policy and only one representative of each group is measured:
+1. triple: every triple is measured (no coalescing)
+2. ip: one measurement per protocol and IP, the port of the first triple is used
+3. prefix: one measurement per protocol and network prefix, the first triple is used
+The measured path is mapped back to all triples of its group.
+'''
+import collections
+import os
+import socket
+
+POLICIES = ['triple', 'ip', 'prefix']
+
+def network(ip, prefix_length, prefix_length_v6):
+    '''
+    returns the network prefix of an IPv4 or IPv6 address as string, e.g. 1.2.3.0/24
+    '''
+    if ':' in ip:
+        family, length = socket.AF_INET6, int(prefix_length_v6)
+    else:
+        family, length = socket.AF_INET, int(prefix_length)
+    packed = bytearray(socket.inet_pton(family, ip))
+    i = 0
+    while i < len(packed):
+        #number of bits of this byte that belong to the prefix
+        keep = max(0, min(8, length - 8 * i))
+        packed[i] = packed[i] & ((0xff << (8 - keep)) & 0xff)
+        i = i+1
+    return socket.inet_ntop(family, bytes(packed)) + '/' + str(length)
+
+def group_key(triple, policy, prefix_length, prefix_length_v6):
+    '''
+    returns the key of the group a triple belongs to
+    '''
+    if policy == 'ip':
+        return (triple[0], triple[1])
+    if policy == 'prefix':
+        return (triple[0], network(triple[1], prefix_length, prefix_length_v6))
+    return triple
+
+class Coalescer():
+    '''
+    Groups triples one after another, e.g. while a capture is still analysed.
+    groups maps each representative to the list of all triples it covers.
+    '''
+    def __init__(self, policy='triple', prefix_length=24, prefix_length_v6=48):
+        if policy not in POLICIES:
+            raise ValueError('unknown coalescing policy ' + policy)
+        self.policy = policy
+        self.prefix_length = prefix_length
+        self.prefix_length_v6 = prefix_length_v6
+        self.representatives = {}
+        self.groups = collections.OrderedDict()
+
+    def add(self, triple):
+        '''
+        Adds a triple to its group.
+        returns the triple if it is the representative of a new group, otherwise None
+        '''
+        key = group_key(triple, self.policy, self.prefix_length, self.prefix_length_v6)
+        if key in self.representatives:
+            self.groups[self.representatives[key]].append(triple)
+            return None
+        self.representatives[key] = triple
+        self.groups[triple] = [triple]
+        return triple
+
+def coalesce(triples, policy='triple', prefix_length=24, prefix_length_v6=48):
+    '''
+    returns an ordered dictionary: representative triple -> list of all triples it covers
+    The representative of a group is its first triple.
+    '''
+    coalescer = Coalescer(policy, prefix_length, prefix_length_v6)
+    for triple in triples:
+        coalescer.add(triple)
+    return coalescer.groups
+
+def write_map(filename, groups, results):
+    '''
+    Writes which measured path covers which triple, one triple per line:
+    protocol ip port measured_protocol measured_ip measured_port result_file
+    results maps each representative to the file name of its path measurement.
+    '''
+    f = open(filename, 'w')
+    f.write('#proto\tip\tport\tmeasured_proto\tmeasured_ip\tmeasured_port\tresult\n')
+    for representative, triples in groups.items():
+        result = results.get(representative, '')
+        for triple in triples:
+            f.write('\t'.join([str(value) for value in triple] +
+                              [str(value) for value in representative] + [result]) + '\n')
+    f.close()
+
+def read_map(filename):
+    '''
+    returns the result files of a path map written by write_map:
+    measured triple -> result file
+    If the file does not exist, an empty dictionary is returned.
+    '''
+    results = {}
+    if not os.path.exists(filename):
+        return results
+    f = open(filename)
+    for line in f:
+        if line.startswith('#'):
+            continue
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) < 7 or fields[6] == '':
+            continue
+        results[(fields[3], fields[4], int(fields[5]))] = fields[6]
+    f.close()
+    return results
@@ -0,0 +1,101 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Collects the DNS responses of a capture in memory.
+The answers are deduplicated per requested hostname and written once at the end
+into one JSON lines file per capture.
+The old layout with one file per requested hostname can be exported additionally.
+'''
+import collections
+import json
+
+def text(value):
+    '''
+    returns a value of a scapy field as unicode text for the JSON file
+    '''
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return str(value)
+
+class DnsSink():
+    '''
+    Maps each requested hostname to its answers in order of their first appearance.
+    '''
+    def __init__(self):
+        self.names = collections.OrderedDict()
+
+    def add(self, dns, timestamp):
+        '''
+        Adds the answers of a DNS response dissected by scapy
+        '''
+        qname = dns.qd.qname
+        entry = self.names.get(qname)
+        if entry is None:
+            entry = {'answers': collections.OrderedDict(), 'responses': 0,
+                     'first': timestamp, 'last': timestamp}
+            self.names[qname] = entry
+        entry['responses'] = entry['responses'] + 1
+        entry['first'] = min(entry['first'], timestamp)
+        entry['last'] = max(entry['last'], timestamp)
+        i = 0
+        while i < dns.ancount:
+            entry['answers'][str(dns.an[i].rdata)] = True
+            i = i+1
+
+    def merge(self, other):
+        '''
+        Adds all hostnames and answers of another sink
+        '''
+        for qname, other_entry in other.names.items():
+            entry = self.names.get(qname)
+            if entry is None:
+                entry = {'answers': collections.OrderedDict(), 'responses': 0,
+                         'first': other_entry['first'], 'last': other_entry['last']}
+                self.names[qname] = entry
+            entry['responses'] = entry['responses'] + other_entry['responses']
+            entry['first'] = min(entry['first'], other_entry['first'])
+            entry['last'] = max(entry['last'], other_entry['last'])
+            for answer in other_entry['answers']:
+                entry['answers'][answer] = True
+
+    def __len__(self):
+        return len(self.names)
+
+    def write(self, filename):
+        '''
+        Writes one JSON object per requested hostname and line:
+        {"qname": ..., "answers": [...], "responses": n, "first": t, "last": t}
+        '''
+        f = open(filename, 'w')
+        for qname, entry in self.names.items():
+            line = json.dumps(collections.OrderedDict([
+                ('qname', text(qname)),
+                ('answers', [text(answer) for answer in entry['answers']]),
+                ('responses', entry['responses']),
+                ('first', float(entry['first'])),
+                ('last', float(entry['last']))]))
+            f.write(line + '\n')
+        f.close()
+
+    def export(self, prefix):
+        '''
+        Writes the old layout: one file per requested hostname named prefix + hostname
+        with one answer per line
+        '''
+        for qname, entry in self.names.items():
+            f = open(prefix + text(qname), 'w')
+            for answer in entry['answers']:
+                f.write(answer + '\n')
+            f.close()
@@ -0,0 +1,117 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Map of the IPs to the domain names they were resolved from.
+The map is built from the A and AAAA answers of the DNS responses while the capture is read,
+the flows are labelled with the domain name of their IP.
+It is stored per experiment in the storage directory, the applications of one experiment
+share it, because the smartphone may reuse a DNS answer of a previous application.
+'''
+import fcntl
+import json
+import os
+import dns_sink
+
+#Resource record types of IPv4 and IPv6 addresses
+ADDRESS_TYPES = [1, 28]
+
+def name(qname):
+    '''
+    returns a requested hostname of scapy as ASCII text
+    '''
+    return dns_sink.text(qname).encode('ascii', 'replace').decode('ascii')
+
+class DomainMap():
+    '''
+    Maps each IP to the requested hostname of the latest DNS response that contained it
+    and the timestamp of that response.
+    '''
+    def __init__(self):
+        self.ips = {}
+
+    def add(self, dns, timestamp):
+        '''
+        Adds the addresses of a DNS response dissected by scapy
+        '''
+        qname = None
+        i = 0
+        while i < dns.ancount:
+            record = dns.an[i]
+            if record.type in ADDRESS_TYPES:
+                if qname is None:
+                    qname = name(dns.qd.qname)
+                #The answers of the capture itself always replace older entries
+                self.ips[str(record.rdata)] = [qname, float(timestamp)]
+            i = i+1
+
+    def update(self, ip, qname, timestamp):
+        '''
+        Sets the hostname of an IP, unless the map holds a newer one
+        '''
+        entry = self.ips.get(ip)
+        if entry is None or entry[1] <= timestamp:
+            self.ips[ip] = [qname, timestamp]
+
+    def lookup(self, ip):
+        '''
+        returns the hostname of an IP or None
+        '''
+        entry = self.ips.get(ip)
+        if entry is None:
+            return None
+        return entry[0]
+
+    def merge(self, other):
+        '''
+        Adds all entries of another map
+        '''
+        for ip, entry in other.ips.items():
+            self.update(ip, entry[0], entry[1])
+
+    def __len__(self):
+        return len(self.ips)
+
+    def load(self, filename):
+        '''
+        Adds the entries of a stored map, a missing or damaged file is ignored
+        '''
+        if not os.path.exists(filename):
+            return
+        f = open(filename)
+        try:
+            stored = json.load(f)
+        except ValueError:
+            print('The domain map ' + filename + ' is damaged and gets rebuilt')
+            stored = {}
+        f.close()
+        for ip, entry in stored.items():
+            self.update(str(ip), entry[0], entry[1])
+
+    def save(self, filename):
+        '''
+        Stores the map. The analyses of several applications may run at the same time,
+        the stored map is read again under a lock and merged before it is replaced.
+        '''
+        lock = open(filename + '.lock', 'w')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            self.load(filename)
+            f = open(filename + '.tmp', 'w')
+            json.dump(self.ips, f, sort_keys=True)
+            f.close()
+            os.rename(filename + '.tmp', filename)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
@@ -0,0 +1,346 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Extractors of the analysis module.
+The capture is dissected once, every packet is handed to all enabled extractors
+and each extractor writes its own output at the end.
+A new metric is a subclass of Extractor that is registered with @register,
+it is enabled in the extractors section of the analysis.ini.
+The flows and DNS extractors are always enabled, the path measurements depend on them.
+The time spent in each extractor is measured to find the expensive ones.
+'''
+import collections
+import time
+from scapy.all import *
+import flows
+import dns_sink
+
+REGISTRY = collections.OrderedDict()
+
+#Extractors that are always enabled, in this order, the flows are merged before the DNS answers
+REQUIRED = ['flows', 'dns']
+
+def register(cls):
+    '''
+    Class decorator, registers an extractor under its name.
+    An extractor with parallel set has to implement merge().
+    '''
+    if cls.parallel and not hasattr(cls, 'merge'):
+        raise ExtractorException(cls.name + ' is parallel but does not implement merge()')
+    REGISTRY[cls.name] = cls
+    return cls
+
+def remote_triple(p, protocol, layer, ipaddress):
+    '''
+    returns the triple (protocol, IP, port) of the remote side of a packet.
+    The IP address of the framework device is no target for path measurements,
+    if the device sent the packet the destination is used, otherwise the source.
+    '''
+    network = IP
+    if not p.haslayer(IP):
+        network = IPv6
+    if p[network].src == ipaddress:
+        return (protocol, p[network].dst, p[layer].dport)
+    return (protocol, p[network].src, p[layer].sport)
+
+class ExtractorException(Exception):
+    '''
+    Exception if an enabled extractor is not registered
+    '''
+    def __init__(self, value):
+        self.value = value
+    def __str__(self):
+        return repr(self.value)
+
+class Extractor():
+    '''
+    Base class of the extractors.
+    context is a dictionary with the config, the prefix of the output files,
+    the IP address of the framework device, the blacklist, the domain map of the DNS answers
+    and the geo lookup (None if disabled).
+    Only extractors that set parallel can be used with the parallel decoding.
+    They are created once per byte range and have to implement merge(other),
+    which adds the results of the same extractor of the following byte range;
+    the partial extractors are merged in the order of the ranges.
+    '''
+    name = None
+    parallel = False
+
+    def __init__(self, context):
+        self.context = context
+        self.seconds = 0.0
+        self.packets = 0
+
+    def option(self, section, option, default):
+        '''
+        returns an option of the analysis.ini or the default value if the option is missing
+        '''
+        config = self.context['config']
+        if config.has_option(section, option):
+            return config.get(section, option, 0)
+        return default
+
+    def handle(self, p):
+        '''
+        Hands a packet to the extractor and measures the time it takes
+        '''
+        started = time.time()
+        self.packet(p)
+        self.seconds = self.seconds + time.time() - started
+        self.packets = self.packets + 1
+
+    def packet(self, p):
+        '''
+        Called with every packet dissected by scapy
+        '''
+        pass
+
+    def decoded(self, capture):
+        '''
+        Called with the capture of the fast decoder (fast_decoder.DecodedCapture) instead of
+        the single packets. returns False if the extractor needs the packets dissected by scapy.
+        '''
+        return False
+
+    def finish(self):
+        '''
+        Writes the output, called once after the last packet
+        '''
+        pass
+
+def create(enabled, context):
+    '''
+    returns the required and the enabled extractors by name, enabled is separated by commas
+    '''
+    names = list(REQUIRED)
+    for name in enabled.replace(',', ' ').split():
+        if name not in REGISTRY:
+            raise ExtractorException(name + ' is no extractor, possible: ' + ', '.join(REGISTRY))
+        if name not in names:
+            names = names + [name]
+    active = collections.OrderedDict()
+    for name in names:
+        active[name] = REGISTRY[name](context)
+    return active
+
+def extract(packets, active):
+    '''
+    Hands every packet to all extractors in one pass.
+    returns the seconds the pass took including the dissection
+    '''
+    handlers = [extractor.handle for extractor in active.values()]
+    started = time.time()
+    for p in packets:
+        for handle in handlers:
+            handle(p)
+    return time.time() - started
+
+def timing(active, seconds):
+    '''
+    returns a line with the time of the dissection and of each extractor
+    '''
+    spent = sum([extractor.seconds for extractor in active.values()])
+    parts = ['dissection %.2f s' % max(seconds - spent, 0.0)]
+    for name, extractor in active.items():
+        parts = parts + ['%s %.2f s' % (name, extractor.seconds)]
+    return 'Extractor timing: ' + ', '.join(parts)
+
+@register
+class FlowExtractor(Extractor):
+    '''
+    Counts all TCP and UDP packets except DNS in the flow table.
+    To make in application path measurement, a triple for each network connection is necessary:
+    1. used protocol: TCP or UDP
+    2. IP address
+    3. Port number
+    A new flow is labelled with the domain name its IP was resolved from by the DNS answers seen so far.
+    The optional function new_flow is called with the triple of each new flow.
+    '''
+    name = 'flows'
+    parallel = True
+
+    def __init__(self, context):
+        Extractor.__init__(self, context)
+        self.flow_table = flows.FlowTable()
+        self.labels = {}
+        self.new_flow = None
+
+    def packet(self, p):
+        if p.haslayer(UDP):
+            if p.haslayer(DNS):
+                return
+            triple = remote_triple(p, 'UDP', UDP, self.context['ipaddress'])
+        elif p.haslayer(TCP):
+            #The same for TCP as for UDP
+            triple = remote_triple(p, 'TCP', TCP, self.context['ipaddress'])
+        else:
+            return
+        if triple not in self.flow_table.flows:
+            domain = self.context['domains'].lookup(triple[1])
+            if domain is not None:
+                self.labels[triple] = domain
+            self.flow_table.add(triple, p.wirelen or len(p), p.time)
+            if self.new_flow is not None:
+                self.new_flow(triple)
+        else:
+            self.flow_table.add(triple, p.wirelen or len(p), p.time)
+
+    def decoded(self, capture):
+        capture.flows(self.context['ipaddress'], self.flow_table)
+        return True
+
+    def merge(self, other):
+        '''
+        The ranges are decoded with empty domain maps. A flow that first appears in this range and
+        was not labelled by the DNS answers of the range gets the domain of the previous ranges,
+        the DNS answers of this range are merged afterwards by the dns extractor.
+        '''
+        domains = self.context['domains']
+        for triple in other.flow_table.flows:
+            if triple in self.flow_table.flows:
+                continue
+            domain = other.labels.get(triple) or domains.lookup(triple[1])
+            if domain is not None:
+                self.labels[triple] = domain
+        self.flow_table.merge(other.flow_table)
+
+    def finish(self):
+        '''
+        The flow summary holds all flows with their statistics and domain names.
+        Flows whose IP was resolved only after their first packet are labelled with the complete map.
+        '''
+        domains = self.context['domains']
+        for triple in self.flow_table.flows:
+            if triple not in self.labels:
+                domain = domains.lookup(triple[1])
+                if domain is not None:
+                    self.labels[triple] = domain
+        columns = [('domain', self.labels)]
+        geo = self.context.get('geo')
+        if geo is not None:
+            #ASN and country of the remote IPs from the geo databases
+            asns = {}
+            countries = {}
+            for triple in self.flow_table.flows:
+                asns[triple], countries[triple] = geo.lookup(triple[1])
+            columns = columns + [('asn', asns), ('country', countries)]
+        self.flow_table.write(self.context['prefix'] + '_flows.txt',
+                              self.context['blacklist'].blocked, columns)
+
+@register
+class DnsExtractor(Extractor):
+    '''
+    DNS resolutions are not considered for the path measurements.
+    The DNS responses are collected in the sink and stored at the end in one file.
+    '''
+    name = 'dns'
+    parallel = True
+
+    def __init__(self, context):
+        Extractor.__init__(self, context)
+        self.dns_answers = dns_sink.DnsSink()
+
+    def packet(self, p):
+        if p.haslayer(DNS) and p[DNS].qr == 1 and p.haslayer(UDP):
+            self.dns_answers.add(p[DNS], p.time)
+            self.context['domains'].add(p[DNS], p.time)
+
+    def decoded(self, capture):
+        for index in capture.dns_responses():
+            dns = DNS(capture.udp_payload(index))
+            self.dns_answers.add(dns, capture.packets['time'][index])
+            self.context['domains'].add(dns, capture.packets['time'][index])
+        return True
+
+    def merge(self, other):
+        self.dns_answers.merge(other.dns_answers)
+        self.context['domains'].merge(other.context['domains'])
+
+    def finish(self):
+        self.dns_answers.write(self.context['prefix'] + '_DNS.jsonl')
+        if self.option('general', 'dns_per_qname_files', 'False') == 'True':
+            #The old layout: the requested hostname is the filename and the IPs the content
+            self.dns_answers.export(self.context['prefix'] + '_DNS_')
+
+def server_name(payload):
+    '''
+    returns the server name indication of a TLS ClientHello or None.
+    Only a ClientHello that starts at the beginning of the TCP payload is parsed.
+    '''
+    data = bytearray(payload)
+    if len(data) < 43 or data[0] != 0x16 or data[5] != 0x01:
+        return None
+    #Record header (5 bytes), handshake header (4), version (2), random (32)
+    position = 43
+    try:
+        position = position + 1 + data[position]
+        position = position + 2 + (data[position] << 8 | data[position+1])
+        position = position + 1 + data[position]
+        end = min(len(data), position + 2 + (data[position] << 8 | data[position+1]))
+        position = position + 2
+        while position + 4 <= end:
+            kind = data[position] << 8 | data[position+1]
+            length = data[position+2] << 8 | data[position+3]
+            position = position + 4
+            if kind == 0:
+                #server_name list: length (2), name type (1), name length (2), name
+                if data[position+2] != 0:
+                    return None
+                size = data[position+3] << 8 | data[position+4]
+                name = data[position+5:position+5+size]
+                if len(name) != size:
+                    return None
+                return ''.join([chr(c) if 32 < c < 127 else '?' for c in name])
+            position = position + length
+    except IndexError:
+        return None
+    return None
+
+@register
+class SniExtractor(Extractor):
+    '''
+    Collects the server names of the TLS connections per flow,
+    written into prefix + '_sni.txt': protocol ip port server_name
+    '''
+    name = 'sni'
+    parallel = True
+
+    def __init__(self, context):
+        Extractor.__init__(self, context)
+        self.names = collections.OrderedDict()
+
+    def packet(self, p):
+        if not p.haslayer(TCP):
+            return
+        payload = bytes(p[TCP].payload)
+        if not payload.startswith(b'\x16'):
+            return
+        name = server_name(payload)
+        if name is not None:
+            triple = remote_triple(p, 'TCP', TCP, self.context['ipaddress'])
+            self.names.setdefault(triple, collections.OrderedDict())[name] = True
+
+    def merge(self, other):
+        for triple, names in other.names.items():
+            for name in names:
+                self.names.setdefault(triple, collections.OrderedDict())[name] = True
+
+    def finish(self):
+        f = open(self.context['prefix'] + '_sni.txt', 'w')
+        f.write('#proto\tip\tport\tserver_name\n')
+        for triple, names in self.names.items():
+            for name in names:
+                f.write('\t'.join([triple[0], triple[1], str(triple[2]), name]) + '\n')
+        f.close()
@@ -0,0 +1,301 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Fast path decoder for .dump files.
+The analysis only needs the IP version, the transport layer protocol, the addresses and ports
+of each packet and the payload of DNS responses.
+Instead of dissecting every packet with scapy, the capture is mapped into memory
+and those header fields are extracted for all packets at once into a NumPy structured array.
+Scapy is only needed afterwards for the DNS responses.
+
+Supported link types: Ethernet (with one VLAN tag), raw IP and Linux cooked capture.
+IPv6 extension headers are not followed, non-first IPv4 fragments carry no ports.
+'''
+import array
+import mmap
+import socket
+import struct
+import pcap_reader
+
+try:
+    import numpy
+except ImportError:
+    #The fast path is optional, the analysis falls back to scapy without NumPy
+    numpy = None
+
+#Link type: (offset of the ethertype or None for raw IP, offset of the network layer)
+LINK_TYPES = {1: (12, 14),
+              12: (None, 0),
+              101: (None, 0),
+              113: (14, 16)}
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = 0x8100
+
+PROTO_TCP = 6
+PROTO_UDP = 17
+
+#UDP ports scapy dissects as DNS
+DNS_PORTS = [53, 5353]
+
+def packet_dtype():
+    '''
+    returns the dtype of the structured array with one row per packet
+    '''
+    return numpy.dtype([('time', 'f8'),
+                        ('wirelen', 'u4'),
+                        ('caplen', 'u4'),
+                        ('l4', 'u8'),
+                        ('end', 'u8'),
+                        ('version', 'u1'),
+                        ('proto', 'u1'),
+                        ('src', 'u1', (16,)),
+                        ('dst', 'u1', (16,)),
+                        ('sport', 'u2'),
+                        ('dport', 'u2')])
+
+def available():
+    '''
+    returns True if NumPy is installed and the fast path can be used
+    '''
+    return numpy is not None
+
+class DecodedCapture():
+    '''
+    Maps a pcap file into memory and decodes the headers of all packets.
+    The decoded fields are stored in the structured array self.packets,
+    the UDP payloads stay accessible with udp_payload().
+    '''
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        header = self.file.read(pcap_reader.FILE_HEADER_LENGTH)
+        if (len(header) < pcap_reader.FILE_HEADER_LENGTH or
+                header[:4] not in pcap_reader.MAGIC_NUMBERS):
+            self.file.close()
+            raise pcap_reader.PcapException(filename + ' is not a pcap file')
+        endian, nanoseconds = pcap_reader.MAGIC_NUMBERS[header[:4]]
+        self.linktype = struct.unpack(endian + 'I', header[20:24])[0]
+        if self.linktype not in LINK_TYPES:
+            self.file.close()
+            raise pcap_reader.PcapException('link type ' + str(self.linktype) +
+                                            ' is not supported by the fast decoder')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = numpy.frombuffer(self.map, dtype=numpy.uint8)
+        self.packets = self.decode(endian, nanoseconds)
+
+    def index_records(self, endian):
+        '''
+        Walks once over the record headers and returns the timestamps, lengths and
+        data offsets of all complete records.
+        '''
+        unpack_from = struct.Struct(endian + 'IIII').unpack_from
+        size = len(self.map)
+        seconds = array.array('d')
+        fractions = array.array('d')
+        caplens = array.array('d')
+        wirelens = array.array('d')
+        offsets = array.array('d')
+        offset = pcap_reader.FILE_HEADER_LENGTH
+        while offset + pcap_reader.RECORD_HEADER_LENGTH <= size:
+            sec, frac, caplen, wirelen = unpack_from(self.map, offset)
+            offset = offset + pcap_reader.RECORD_HEADER_LENGTH
+            if offset + caplen > size:
+                break
+            seconds.append(sec)
+            fractions.append(frac)
+            caplens.append(caplen)
+            wirelens.append(wirelen)
+            offsets.append(offset)
+            offset = offset + caplen
+        return [numpy.frombuffer(column, dtype=numpy.float64) if len(column) else
+                numpy.zeros(0) for column in
+                [seconds, fractions, caplens, wirelens, offsets]]
+
+    def gather(self, positions, width):
+        '''
+        returns a (len(positions), width) array with the bytes starting at each position.
+        Positions beyond the end of the file are clipped, the callers mask them out.
+        '''
+        index = positions[:, None] + numpy.arange(width, dtype=numpy.int64)
+        return self.buffer[numpy.minimum(index, len(self.buffer) - 1)]
+
+    def decode(self, endian, nanoseconds):
+        '''
+        Extracts the header fields of all packets into a structured array.
+        '''
+        seconds, fractions, caplens, wirelens, offsets = self.index_records(endian)
+        count = len(offsets)
+        packets = numpy.zeros(count, dtype=packet_dtype())
+        if count == 0:
+            return packets
+        divisor = 1000000000.0 if nanoseconds else 1000000.0
+        offsets = offsets.astype(numpy.int64)
+        caplens = caplens.astype(numpy.int64)
+        ends = offsets + caplens
+        packets['time'] = seconds + fractions / divisor
+        packets['wirelen'] = wirelens
+        packets['caplen'] = caplens
+        packets['end'] = ends
+
+        #Network layer: determine the IP version from the ethertype or the first nibble
+        ethertype_offset, l3_offset = LINK_TYPES[self.linktype]
+        l3 = offsets + l3_offset
+        if ethertype_offset is None:
+            version = self.gather(l3, 1)[:, 0] >> 4
+        else:
+            ethertype = self.gather(offsets + ethertype_offset, 2).astype(numpy.uint16)
+            ethertype = (ethertype[:, 0] << 8) | ethertype[:, 1]
+            vlan = ethertype == ETHERTYPE_VLAN
+            if vlan.any():
+                inner = self.gather(offsets[vlan] + ethertype_offset + 4, 2).astype(numpy.uint16)
+                ethertype[vlan] = (inner[:, 0] << 8) | inner[:, 1]
+                l3[vlan] = l3[vlan] + 4
+            version = numpy.zeros(count, dtype=numpy.uint8)
+            version[ethertype == ETHERTYPE_IPV4] = 4
+            version[ethertype == ETHERTYPE_IPV6] = 6
+
+        ipv4 = (version == 4) & (l3 + 20 <= ends)
+        ipv6 = (version == 6) & (l3 + 40 <= ends)
+        packets['version'][ipv4] = 4
+        packets['version'][ipv6] = 6
+
+        l4 = numpy.zeros(count, dtype=numpy.int64)
+        has_l4 = numpy.zeros(count, dtype=bool)
+        if ipv4.any():
+            header = self.gather(l3[ipv4], 20)
+            fragment = ((header[:, 6].astype(numpy.uint16) & 0x1f) << 8) | header[:, 7]
+            packets['proto'][ipv4] = header[:, 9]
+            packets['src'][ipv4, :4] = header[:, 12:16]
+            packets['dst'][ipv4, :4] = header[:, 16:20]
+            l4[ipv4] = l3[ipv4] + (header[:, 0] & 0x0f).astype(numpy.int64) * 4
+            has_l4[ipv4] = fragment == 0
+        if ipv6.any():
+            header = self.gather(l3[ipv6], 40)
+            packets['proto'][ipv6] = header[:, 6]
+            packets['src'][ipv6] = header[:, 8:24]
+            packets['dst'][ipv6] = header[:, 24:40]
+            l4[ipv6] = l3[ipv6] + 40
+            has_l4[ipv6] = True
+
+        #Transport layer: only the ports of TCP and UDP are needed
+        proto = packets['proto']
+        ports = has_l4 & ((proto == PROTO_TCP) | (proto == PROTO_UDP)) & (l4 + 4 <= ends)
+        if ports.any():
+            header = self.gather(l4[ports], 4).astype(numpy.uint16)
+            packets['sport'][ports] = (header[:, 0] << 8) | header[:, 1]
+            packets['dport'][ports] = (header[:, 2] << 8) | header[:, 3]
+        #Packets without ports are treated like packets without transport layer
+        packets['proto'][~ports] = 0
+        packets['l4'] = l4
+        return packets
+
+    def udp_payload(self, index):
+        '''
+        returns the payload of an UDP packet, trimmed to the length given in the UDP header
+        '''
+        row = self.packets[index]
+        start = int(row['l4'])
+        length = struct.unpack('!H', self.map[start + 4:start + 6])[0]
+        return self.map[start + 8:min(start + max(length, 8), int(row['end']))]
+
+    def dns_responses(self):
+        '''
+        returns the indices of all UDP packets with a DNS port and the response flag set
+        '''
+        packets = self.packets
+        udp = packets['proto'] == PROTO_UDP
+        dns = udp & (numpy.in1d(packets['sport'], DNS_PORTS) |
+                     numpy.in1d(packets['dport'], DNS_PORTS))
+        #The QR flag is the first bit of the third byte of the DNS header
+        flags = self.gather(packets['l4'][dns].astype(numpy.int64) + 10, 1)[:, 0]
+        complete = packets['l4'][dns] + 20 <= packets['end'][dns]
+        indices = numpy.nonzero(dns)[0]
+        return indices[((flags & 0x80) != 0) & complete]
+
+    def flows(self, ipaddress, table):
+        '''
+        Adds all packets to the flow table, keyed by the triple (protocol, remote IP, remote port).
+        The remote side is the destination of packets sent from ipaddress and the source of
+        all other packets. UDP packets with a DNS port are not considered.
+        The statistics are aggregated per flow with NumPy and the flows are added to the table
+        in order of their first appearance.
+        '''
+        packets = self.packets
+        proto = packets['proto']
+        udp = proto == PROTO_UDP
+        dns = udp & (numpy.in1d(packets['sport'], DNS_PORTS) |
+                     numpy.in1d(packets['dport'], DNS_PORTS))
+        selected = ((proto == PROTO_TCP) | udp) & ~dns
+        if not selected.any():
+            return table
+        outgoing = numpy.all(packets['src'] == pack_address(ipaddress), axis=1)
+
+        remote_ip = numpy.where(outgoing[:, None], packets['dst'], packets['src'])[selected]
+        remote_port = numpy.where(outgoing, packets['dport'], packets['sport'])[selected]
+        keys = numpy.zeros((len(remote_port), 20), dtype=numpy.uint8)
+        keys[:, 0] = proto[selected]
+        keys[:, 1] = packets['version'][selected]
+        keys[:, 2:18] = remote_ip
+        keys[:, 18] = remote_port >> 8
+        keys[:, 19] = remote_port & 0xff
+        unique, first_index, inverse = numpy.unique(keys, axis=0, return_index=True,
+                                                    return_inverse=True)
+        times = packets['time'][selected]
+        counts = numpy.bincount(inverse, minlength=len(unique))
+        lengths = numpy.bincount(inverse, weights=packets['wirelen'][selected],
+                                 minlength=len(unique))
+        first = numpy.full(len(unique), numpy.inf)
+        last = numpy.full(len(unique), -numpy.inf)
+        numpy.minimum.at(first, inverse, times)
+        numpy.maximum.at(last, inverse, times)
+
+        for flow in numpy.argsort(first_index, kind='mergesort'):
+            key = unique[flow]
+            name = 'TCP' if key[0] == PROTO_TCP else 'UDP'
+            triple = (name, unpack_address(key[1], key[2:18]), (int(key[18]) << 8) | int(key[19]))
+            table.update(triple, int(counts[flow]), int(lengths[flow]),
+                         float(first[flow]), float(last[flow]))
+        return table
+
+    def close(self):
+        '''
+        closes the memory map and the file
+        '''
+        self.buffer = None
+        self.map.close()
+        self.file.close()
+
+def pack_address(ipaddress):
+    '''
+    returns an IPv4 or IPv6 address as 16 byte array like it is stored in the packet array
+    '''
+    packed = numpy.zeros(16, dtype=numpy.uint8)
+    if ipaddress == '':
+        return packed
+    if ':' in ipaddress:
+        raw = socket.inet_pton(socket.AF_INET6, ipaddress)
+    else:
+        raw = socket.inet_pton(socket.AF_INET, ipaddress)
+    packed[:len(raw)] = numpy.frombuffer(raw, dtype=numpy.uint8)
+    return packed
+
+def unpack_address(version, packed):
+    '''
+    returns the string representation of an address stored in the packet array
+    '''
+    if version == 6:
+        return socket.inet_ntop(socket.AF_INET6, packed.tobytes())
+    return socket.inet_ntop(socket.AF_INET, packed[:4].tobytes())
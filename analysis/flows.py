@@ -0,0 +1,106 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Flow table of the analysis module.
+A flow is identified by the triple (protocol, remote IP, remote port).
+For each flow the number of packets, the number of bytes and the timestamps of the first
+and the last packet are counted.
+The table is written as flow summary next to the .dump file.
+'''
+import collections
+
+class FlowTable():
+    '''
+    Hash based flow table.
+    The flows keep the order of their first appearance in the capture.
+    '''
+    def __init__(self):
+        self.flows = collections.OrderedDict()
+
+    def add(self, triple, length, timestamp):
+        '''
+        Counts one packet with the given length and timestamp for the flow
+        '''
+        self.update(triple, 1, length, timestamp, timestamp)
+
+    def update(self, triple, packets, length, first, last):
+        '''
+        Adds already aggregated statistics to a flow,
+        e.g. from the fast decoder or from another flow table
+        '''
+        flow = self.flows.get(triple)
+        if flow is None:
+            self.flows[triple] = [packets, length, first, last]
+        else:
+            flow[0] = flow[0] + packets
+            flow[1] = flow[1] + length
+            flow[2] = min(flow[2], first)
+            flow[3] = max(flow[3], last)
+
+    def merge(self, other):
+        '''
+        Adds all flows of another flow table
+        '''
+        for triple, flow in other.flows.items():
+            self.update(triple, flow[0], flow[1], flow[2], flow[3])
+
+    def triples(self):
+        '''
+        returns all triples in order of their first appearance
+        '''
+        return list(self.flows.keys())
+
+    def __len__(self):
+        return len(self.flows)
+
+    def write(self, filename, excluded=None, columns=None):
+        '''
+        Writes the flow summary, one flow per line:
+        protocol ip port packets bytes first_timestamp last_timestamp blacklisted [columns]
+        excluded is an optional function returning True for blacklisted triples.
+        columns is an optional list of additional columns (name, dictionary triple: value),
+        e.g. the domain name of the IP, missing values are written as -
+        '''
+        if columns is None:
+            columns = []
+        f = open(filename, 'w')
+        header = ['#proto', 'ip', 'port', 'packets', 'bytes', 'first', 'last', 'blacklisted']
+        f.write('\t'.join(header + [name for name, values in columns]) + '\n')
+        for triple, flow in self.flows.items():
+            blacklisted = excluded is not None and excluded(triple)
+            fields = [triple[0], triple[1], str(triple[2]), str(flow[0]), str(flow[1]),
+                      '%.6f' % flow[2], '%.6f' % flow[3], str(blacklisted)]
+            for name, values in columns:
+                value = values.get(triple)
+                if value is None:
+                    value = '-'
+                fields = fields + [str(value)]
+            f.write('\t'.join(fields) + '\n')
+        f.close()
+
+def read(filename):
+    '''
+    Reads a flow summary written by FlowTable.write into a new flow table
+    '''
+    table = FlowTable()
+    f = open(filename)
+    for line in f:
+        if line.startswith('#'):
+            continue
+        fields = line.rstrip('\n').split('\t')
+        table.update((fields[0], fields[1], int(fields[2])), int(fields[3]), int(fields[4]),
+                     float(fields[5]), float(fields[6]))
+    f.close()
+    return table
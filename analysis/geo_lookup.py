@@ -0,0 +1,128 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+ASN and country of IPs from local MaxMind databases (.mmdb), e.g. GeoLite2-ASN and GeoLite2-Country.
+The databases are memory-mapped once per process and shared by all analyses of the process,
+e.g. of the analysis daemon or of reprocess.py.
+The same router IPs appear on many paths, the lookups are cached in an LRU cache.
+Needs the maxminddb module.
+'''
+import collections
+
+try:
+    import maxminddb
+except ImportError:
+    #The enrichment is optional, the analysis runs without it
+    maxminddb = None
+
+#Opened lookups of this process by (asn database, country database, cache size)
+SHARED = {}
+
+def available():
+    '''
+    returns True if the maxminddb module is installed
+    '''
+    return maxminddb is not None
+
+class GeoLookup():
+    '''
+    Looks up the ASN and the country code of IPs.
+    Either database may be empty, its fields are None then.
+    At most cache_size results are cached, the least recently used one is evicted.
+    '''
+    def __init__(self, asn_database, country_database, cache_size):
+        self.asn_reader = None
+        self.country_reader = None
+        if asn_database != '':
+            self.asn_reader = maxminddb.open_database(asn_database, maxminddb.MODE_MMAP)
+        if country_database != '':
+            self.country_reader = maxminddb.open_database(country_database, maxminddb.MODE_MMAP)
+        self.cache_size = max(int(cache_size), 1)
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def read(self, reader, ip):
+        '''
+        returns the record of an IP in a database or None
+        '''
+        if reader is None:
+            return None
+        try:
+            return reader.get(ip)
+        except ValueError:
+            return None
+
+    def lookup(self, ip):
+        '''
+        returns (ASN, country code) of an IP, unknown fields are None
+        '''
+        result = self.cache.pop(ip, None)
+        if result is not None:
+            self.hits = self.hits + 1
+            self.cache[ip] = result
+            return result
+        self.misses = self.misses + 1
+        asn = None
+        country = None
+        record = self.read(self.asn_reader, ip)
+        if record is not None:
+            asn = record.get('autonomous_system_number')
+        record = self.read(self.country_reader, ip)
+        if record is not None:
+            country = (record.get('country') or record.get('registered_country') or {}).get('iso_code')
+        result = (asn, country)
+        self.cache[ip] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+            self.evictions = self.evictions + 1
+        return result
+
+    def statistics(self):
+        '''
+        returns a line with the hit rate of the cache
+        '''
+        lookups = self.hits + self.misses
+        rate = 0.0
+        if lookups > 0:
+            rate = 100.0 * self.hits / lookups
+        return ('Geo lookups: %d, cache hits: %d (%.1f %%), entries: %d, evictions: %d' %
+                (lookups, self.hits, rate, len(self.cache), self.evictions))
+
+def shared(asn_database, country_database, cache_size):
+    '''
+    returns the lookup of this process for the databases, they are opened on the first call
+    '''
+    key = (asn_database, country_database, str(cache_size))
+    if key not in SHARED:
+        SHARED[key] = GeoLookup(asn_database, country_database, cache_size)
+    return SHARED[key]
+
+def from_config(config):
+    '''
+    returns the shared lookup configured in the geo section of the analysis.ini
+    or None if it is disabled or maxminddb is missing
+    '''
+    if not config.has_option('geo', 'enabled') or config.get('geo', 'enabled', 0) != 'True':
+        return None
+    if not available():
+        print('maxminddb is not available, the flows and hops are not enriched')
+        return None
+    options = {'asn_database': '', 'country_database': '', 'cache_size': '65536'}
+    for option in options:
+        if config.has_option('geo', option):
+            options[option] = config.get('geo', option, 0)
+    return shared(options['asn_database'], options['country_database'], options['cache_size'])
@@ -0,0 +1,180 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Columnar storage of the hops of the path measurements.
+The result of each path measurement is parsed as soon as it arrives, one row per probe:
+capture, protocol, IP and port of the target, hop (TTL), probe number, address and round trip time,
+ASN and country of the address if the geo lookup is enabled (see geo_lookup.py).
+A probe without reply has an empty address and NaN as round trip time, an unknown ASN is -1.
+The rows of all captures of one experiment are stored in one NumPy .npz file
+in the storage directory next to the text results, e.g. to compare the paths of all applications.
+
+python hop_store.py 0001_1_hops.npz prints the path of each target.
+'''
+import fcntl
+import os
+import sys
+import traceroute_parser
+
+try:
+    import numpy
+except ImportError:
+    #The hop file is optional, the text results are written without NumPy
+    numpy = None
+
+#Columns and their NumPy types, strings are unicode with a variable length
+COLUMNS = [('capture', 'U'), ('proto', 'U'), ('ip', 'U'), ('port', 'i4'),
+           ('hop', 'i2'), ('probe', 'i2'), ('address', 'U'), ('rtt', 'f4'),
+           ('asn', 'i4'), ('country', 'U')]
+
+def available():
+    '''
+    returns True if NumPy is installed and the hops can be stored
+    '''
+    return numpy is not None
+
+class HopStore():
+    '''
+    Collects the probes of the path measurements of one capture.
+    geo is an optional geo_lookup.GeoLookup for the ASN and country of the addresses.
+    '''
+    def __init__(self, capture, geo=None):
+        self.capture = capture
+        self.geo = geo
+        self.rows = []
+        self.parsed = set()
+
+    def add(self, triple, filename):
+        '''
+        Parses the result file of the path measurement to a triple
+        '''
+        if triple in self.parsed:
+            return
+        self.parsed.add(triple)
+        counts = {}
+        for hop, address, rtt in traceroute_parser.probes_file(filename):
+            counts[hop] = counts.get(hop, 0) + 1
+            if rtt is None:
+                rtt = float('nan')
+            asn, country = None, None
+            if self.geo is not None and address is not None:
+                asn, country = self.geo.lookup(address)
+            if asn is None:
+                asn = -1
+            self.rows.append((self.capture, triple[0], str(triple[1]), int(triple[2]),
+                              hop, counts[hop], address or '', rtt, asn, country or ''))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def columns(self):
+        '''
+        returns the rows as dictionary of NumPy arrays, one per column
+        '''
+        result = {}
+        i = 0
+        while i < len(COLUMNS):
+            name, dtype = COLUMNS[i]
+            values = [row[i] for row in self.rows]
+            if dtype == 'U':
+                result[name] = numpy.array([u'%s' % value for value in values], dtype='U')
+            else:
+                result[name] = numpy.array(values, dtype=dtype)
+            i = i+1
+        return result
+
+    def save(self, filename):
+        '''
+        Adds the rows to the hop file of the experiment.
+        Rows of the same capture from an earlier analysis are replaced.
+        The analyses of several applications may run at the same time, the file is locked.
+        '''
+        lock = open(filename + '.lock', 'w')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            columns = self.columns()
+            stored = load(filename)
+            if stored is not None:
+                keep = stored['capture'] != u'%s' % self.capture
+                for name, dtype in COLUMNS:
+                    columns[name] = numpy.concatenate([stored[name][keep], columns[name]])
+            f = open(filename + '.tmp', 'wb')
+            numpy.savez_compressed(f, **columns)
+            f.close()
+            os.rename(filename + '.tmp', filename)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+def load(filename):
+    '''
+    returns the columns of a hop file as dictionary of NumPy arrays or None if it does not exist
+    '''
+    if not os.path.exists(filename):
+        return None
+    stored = numpy.load(filename)
+    columns = {}
+    for name, dtype in COLUMNS:
+        if name in stored.files:
+            columns[name] = stored[name]
+        elif dtype == 'U':
+            #Files written before the column was added
+            columns[name] = numpy.array([u''] * len(stored['hop']), dtype='U')
+        else:
+            columns[name] = numpy.full(len(stored['hop']), -1, dtype=dtype)
+    stored.close()
+    return columns
+
+def paths(columns):
+    '''
+    returns the path of each path measurement as dictionary
+    (capture, protocol, IP, port): list of the first responding address of each hop or None
+    '''
+    result = {}
+    order = numpy.lexsort((columns['probe'], columns['hop']))
+    for i in order:
+        key = (columns['capture'][i], columns['proto'][i], columns['ip'][i], int(columns['port'][i]))
+        path = result.setdefault(key, [])
+        hop = int(columns['hop'][i])
+        while len(path) < hop:
+            path.append(None)
+        if path[hop - 1] is None and columns['address'][i] != '':
+            path[hop - 1] = columns['address'][i]
+    return result
+
+def main():
+    '''
+    The script needs 1 parameter:
+    1. The hop file of an experiment
+    '''
+    if len(sys.argv) < 2:
+        print('''
+              The script needs 1 parameter:
+              1. The hop file of an experiment
+              ''')
+        sys.exit(1)
+    if not available():
+        print('NumPy is not available')
+        sys.exit(1)
+    columns = load(sys.argv[1])
+    if columns is None:
+        print(sys.argv[1] + ' does not exist')
+        sys.exit(1)
+    for key, path in sorted(paths(columns).items()):
+        print('\t'.join([key[0], key[1], key[2], str(key[3])] +
+                        [address or '*' for address in path]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+SQLite index of the analysis results of all experiments.
+Each analysed capture is stored with its counter, application, country and host,
+together with its flows, DNS answers and the hops of its path measurements.
+All rows of one capture are inserted in one transaction,
+a capture that is analysed again replaces its old rows.
+
+The script is also a small query tool, for example:
+python index_db.py /home/results/index.sqlite ips application=threema country=BR
+'''
+import os
+import sqlite3
+import sys
+import time
+import dns_sink
+import traceroute_parser
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS captures (id INTEGER PRIMARY KEY, counter TEXT,
+       identifier TEXT, application TEXT, country TEXT, host TEXT, capture TEXT UNIQUE,
+       analysed REAL)''',
+    '''CREATE TABLE IF NOT EXISTS flows (capture INTEGER, proto TEXT, ip TEXT, port INTEGER,
+       packets INTEGER, bytes INTEGER, first REAL, last REAL, blacklisted INTEGER,
+       measured_proto TEXT, measured_ip TEXT, measured_port INTEGER, result TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS dns (capture INTEGER, qname TEXT, answer TEXT,
+       responses INTEGER, first REAL, last REAL)''',
+    '''CREATE TABLE IF NOT EXISTS hops (capture INTEGER, proto TEXT, ip TEXT, port INTEGER,
+       hop INTEGER, address TEXT, rtt REAL, replies INTEGER)''',
+    'CREATE INDEX IF NOT EXISTS captures_key ON captures (application, country, host)',
+    'CREATE INDEX IF NOT EXISTS captures_counter ON captures (counter)',
+    'CREATE INDEX IF NOT EXISTS flows_capture ON flows (capture)',
+    'CREATE INDEX IF NOT EXISTS flows_ip ON flows (ip)',
+    'CREATE INDEX IF NOT EXISTS dns_capture ON dns (capture)',
+    'CREATE INDEX IF NOT EXISTS dns_qname ON dns (qname)',
+    'CREATE INDEX IF NOT EXISTS dns_answer ON dns (answer)',
+    'CREATE INDEX IF NOT EXISTS hops_capture ON hops (capture)',
+    'CREATE INDEX IF NOT EXISTS hops_target ON hops (ip)',
+    'CREATE INDEX IF NOT EXISTS hops_address ON hops (address)']
+
+#Queries of the command line tool: (columns, tables, filter columns, group by)
+QUERIES = {
+    'captures': ('c.counter, c.application, c.country, c.host, c.capture',
+                 'captures c', {}, None),
+    'ips': ('f.proto, f.ip, f.port, COUNT(DISTINCT c.id), SUM(f.packets), SUM(f.bytes)',
+            'flows f JOIN captures c ON f.capture = c.id',
+            {'ip': 'f.ip', 'port': 'f.port', 'proto': 'f.proto'},
+            'f.proto, f.ip, f.port'),
+    'domains': ('d.qname, d.answer, COUNT(DISTINCT c.id), SUM(d.responses)',
+                'dns d JOIN captures c ON d.capture = c.id',
+                {'qname': 'd.qname', 'ip': 'd.answer'},
+                'd.qname, d.answer'),
+    'hops': ('c.counter, c.application, c.country, c.host, h.proto, h.ip, h.port, h.hop, '
+             'h.address, h.rtt',
+             'hops h JOIN captures c ON h.capture = c.id',
+             {'ip': 'h.ip', 'address': 'h.address'},
+             None)}
+
+CAPTURE_FILTERS = {'counter': 'c.counter', 'application': 'c.application',
+                   'country': 'c.country', 'host': 'c.host'}
+
+class IndexDatabase():
+    '''
+    The database file is created with its tables and indexes if it does not exist.
+    Several analysis processes may write into the same database,
+    a locked database is waited for up to timeout seconds.
+    '''
+    def __init__(self, filename, timeout=60):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename, timeout)
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    def insert(self, capture, flows, answers, hops):
+        '''
+        Inserts all rows of one capture in one transaction.
+        capture is a row of the captures table without the id,
+        the other rows are without the capture column.
+        returns the id of the capture
+        '''
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('SELECT id FROM captures WHERE capture = ?', (capture[5],))
+            row = cursor.fetchone()
+            if row is not None:
+                for table in ['flows', 'dns', 'hops']:
+                    cursor.execute('DELETE FROM ' + table + ' WHERE capture = ?', (row[0],))
+                cursor.execute('DELETE FROM captures WHERE id = ?', (row[0],))
+            cursor.execute('INSERT INTO captures (counter, identifier, application, country, host, '
+                           'capture, analysed) VALUES (?, ?, ?, ?, ?, ?, ?)', capture)
+            capture_id = cursor.lastrowid
+            cursor.executemany('INSERT INTO flows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               [(capture_id,) + tuple(row) for row in flows])
+            cursor.executemany('INSERT INTO dns VALUES (?, ?, ?, ?, ?, ?)',
+                               [(capture_id,) + tuple(row) for row in answers])
+            cursor.executemany('INSERT INTO hops VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               [(capture_id,) + tuple(row) for row in hops])
+            self.connection.commit()
+        except:
+            self.connection.rollback()
+            raise
+        return capture_id
+
+    def query(self, name, filters):
+        '''
+        Executes one of the QUERIES with the filters, a list of (filter name, value)
+        and returns the rows
+        '''
+        columns, tables, query_filters, group = QUERIES[name]
+        allowed = dict(CAPTURE_FILTERS)
+        allowed.update(query_filters)
+        conditions = []
+        values = []
+        for key, value in filters:
+            if key not in allowed:
+                raise ValueError('unknown filter ' + key + ' for ' + name + ', possible: ' +
+                                 ', '.join(sorted(allowed)))
+            conditions = conditions + [allowed[key] + ' = ?']
+            values = values + [value]
+        statement = 'SELECT ' + columns + ' FROM ' + tables
+        if conditions:
+            statement = statement + ' WHERE ' + ' AND '.join(conditions)
+        if group is not None:
+            statement = statement + ' GROUP BY ' + group
+        return self.connection.execute(statement, values).fetchall()
+
+    def close(self):
+        '''
+        closes the database
+        '''
+        self.connection.close()
+
+def capture_row(counter, identifier, application, country, host, capture):
+    '''
+    returns the row of a capture for the captures table
+    '''
+    return (counter, identifier, application, country, host, capture, time.time())
+
+def flow_rows(flow_table, excluded, groups, results):
+    '''
+    returns the rows of all flows with the triple whose path measurement covers it
+    groups and results are the coalesced groups and the result files of the path measurements
+    '''
+    measured = {}
+    for representative, triples in groups.items():
+        for triple in triples:
+            measured[triple] = representative
+    rows = []
+    for triple, flow in flow_table.flows.items():
+        representative = measured.get(triple, (None, None, None))
+        rows.append((triple[0], str(triple[1]), int(triple[2]), flow[0], flow[1],
+                     float(flow[2]), float(flow[3]), int(excluded(triple))) +
+                    representative + (results.get(representative),))
+    return rows
+
+def dns_rows(dns_answers):
+    '''
+    returns one row per requested hostname and answer
+    '''
+    rows = []
+    for qname, entry in dns_answers.names.items():
+        for answer in entry['answers']:
+            rows.append((dns_sink.text(qname), dns_sink.text(answer), entry['responses'],
+                         float(entry['first']), float(entry['last'])))
+    return rows
+
+def hop_rows(directory, groups, results):
+    '''
+    returns the parsed hops of all path measurement result files in the directory
+    '''
+    rows = []
+    for triple in groups:
+        if triple not in results:
+            continue
+        for hop in traceroute_parser.parse_file(os.path.join(directory, results[triple])):
+            rows.append((triple[0], str(triple[1]), int(triple[2])) + hop)
+    return rows
+
+def main():
+    '''
+    The script needs at least 2 parameters:
+    1. The database file
+    2. The query: captures, ips, domains or hops
+    Further parameters filter the result, e.g. application=threema country=BR ip=1.2.3.4
+    '''
+    if len(sys.argv) < 3 or sys.argv[2] not in QUERIES:
+        print('''
+              The script needs at least 2 parameters:
+              1. The database file
+              2. The query: captures, ips, domains or hops
+              Further parameters filter the result, e.g. application=threema country=BR ip=1.2.3.4
+              ''')
+        sys.exit(1)
+    if not os.path.exists(sys.argv[1]):
+        print(sys.argv[1] + ' does not exist')
+        sys.exit(1)
+    filters = []
+    for argument in sys.argv[3:]:
+        if '=' not in argument:
+            print('Filters have the form column=value: ' + argument)
+            sys.exit(1)
+        filters = filters + [tuple(argument.split('=', 1))]
+    database = IndexDatabase(sys.argv[1])
+    try:
+        rows = database.query(sys.argv[2], filters)
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+    finally:
+        database.close()
+    for row in rows:
+        print('\t'.join([str(value) for value in row]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+The script matches the flows of the two .dump files of one application execution,
+result_1 of the first and result_2 of the second router.
+Both captures are streamed and merged in time order with a heap, only the flow statistics
+and the bursts within the matching window are held in memory.
+The clock of the second router is corrected by a constant offset.
+
+The packets of a flow are grouped into bursts, a new burst starts after gap seconds without packets.
+A burst that starts on one side and a burst that starts on the other side within window seconds
+afterwards are counted for the pair of their flows, e.g. a message that is sent by the first smartphone
+and received by the second one over a relay server.
+The output lists the flow pairs with at least min_matches matched bursts
+and all flow pairs whose remote IP appears on both sides (relay servers).
+'''
+import ConfigParser
+import collections
+import heapq
+import os
+import sys
+import blacklist
+import fast_decoder
+import flows
+import pcap_reader
+
+def get_option(config, section, option, default):
+    '''
+    returns an option of the config file or the default value if the option is missing
+    '''
+    if config.has_option(section, option):
+        return config.get(section, option, 0)
+    return default
+
+def packets(filename, side, ipaddress, offset, ip_port_blacklist):
+    '''
+    Generator, yields (corrected timestamp, side, remote triple, length) for each TCP and UDP packet
+    of a capture. DNS and blacklisted packets are skipped.
+    '''
+    capture = pcap_reader.PcapFile(filename)
+    try:
+        for timestamp, wirelen, data in capture.records():
+            headers = blacklist.transport(capture.linktype, data)
+            if headers is None:
+                continue
+            protocol, src, sport, dst, dport = headers
+            if protocol == 'UDP' and (sport in fast_decoder.DNS_PORTS or
+                                      dport in fast_decoder.DNS_PORTS):
+                continue
+            if src == ipaddress:
+                triple = (protocol, dst, dport)
+            else:
+                triple = (protocol, src, sport)
+            if ip_port_blacklist.blocked(triple):
+                continue
+            yield (timestamp - offset, side, triple, wirelen or len(data))
+    finally:
+        capture.close()
+
+class Matcher():
+    '''
+    Counts the flows of both sides and the bursts that start within the window on the other side.
+    '''
+    def __init__(self, gap, window):
+        self.gap = gap
+        self.window = window
+        self.tables = [flows.FlowTable(), flows.FlowTable()]
+        self.last = [{}, {}]
+        self.bursts = [collections.Counter(), collections.Counter()]
+        #Starts of the recent bursts of each side: (timestamp, triple)
+        self.recent = [collections.deque(), collections.deque()]
+        #(triple of side 1, triple of side 2): [bursts 1 to 2, bursts 2 to 1, sum of the delays]
+        self.pairs = {}
+
+    def add(self, timestamp, side, triple, length):
+        '''
+        Adds one packet, the packets have to be added in time order
+        '''
+        self.tables[side].add(triple, length, timestamp)
+        last = self.last[side].get(triple)
+        self.last[side][triple] = timestamp
+        if last is not None and timestamp - last <= self.gap:
+            return
+        self.bursts[side][triple] = self.bursts[side][triple] + 1
+        for recent in self.recent:
+            while recent and recent[0][0] < timestamp - self.window:
+                recent.popleft()
+        for start, other in self.recent[1 - side]:
+            if side == 1:
+                key = (other, triple)
+            else:
+                key = (triple, other)
+            pair = self.pairs.get(key)
+            if pair is None:
+                pair = [0, 0, 0.0]
+                self.pairs[key] = pair
+            pair[1 - side] = pair[1 - side] + 1
+            pair[2] = pair[2] + timestamp - start
+        self.recent[side].append((timestamp, triple))
+
+    def shared(self, first, second):
+        '''
+        returns endpoint if both triples are the same, ip if only the IPs are the same, otherwise -
+        '''
+        if first == second:
+            return 'endpoint'
+        if first[1] == second[1]:
+            return 'ip'
+        return '-'
+
+    def matches(self, min_matches):
+        '''
+        returns the matched flow pairs as rows, the pairs with the most matched bursts first
+        '''
+        keys = set([key for key, pair in self.pairs.items() if pair[0] + pair[1] >= min_matches])
+        by_ip = {}
+        for triple in self.tables[1].flows:
+            by_ip.setdefault(triple[1], []).append(triple)
+        for triple in self.tables[0].flows:
+            for other in by_ip.get(triple[1], []):
+                keys.add((triple, other))
+        rows = []
+        for first, second in keys:
+            pair = self.pairs.get((first, second), [0, 0, 0.0])
+            delay = None
+            if pair[0] + pair[1] > 0:
+                delay = pair[2] / (pair[0] + pair[1])
+            rows.append((first, second, self.shared(first, second), self.bursts[0][first],
+                         self.bursts[1][second], pair[0], pair[1], delay))
+        rows.sort(key=lambda row: (-(row[5] + row[6]), row[0], row[1]))
+        return rows
+
+def write(rows, output):
+    '''
+    Writes the matched flow pairs, one pair per line
+    '''
+    output.write('#proto_1\tip_1\tport_1\tproto_2\tip_2\tport_2\tshared\tbursts_1\tbursts_2\t'
+                 '1_to_2\t2_to_1\tmean_delay\n')
+    for first, second, shared, bursts_1, bursts_2, forward, backward, delay in rows:
+        if delay is None:
+            delay = '-'
+        else:
+            delay = '%.3f' % delay
+        output.write('\t'.join([first[0], first[1], str(first[2]), second[0], second[1],
+                                str(second[2]), shared, str(bursts_1), str(bursts_2),
+                                str(forward), str(backward), delay]) + '\n')
+
+def main():
+    '''
+    The script needs 2 parameters:
+    1. The .dump file of the first router (result_1)
+    2. The .dump file of the second router (result_2)
+    Optional parameters, the defaults are taken from the merge section of the analysis.ini:
+    ip1=IP, ip2=IP      IPs of the smartphones behind the first and the second router
+    offset=SECONDS      clock offset of the second router, subtracted from its timestamps
+    gap=SECONDS         pause that starts a new burst of a flow
+    window=SECONDS      maximal delay between matched bursts
+    min_matches=N       matched bursts a flow pair needs to be listed
+    output=FILE         file for the flow pairs instead of the standard output
+    '''
+    if len(sys.argv) < 3:
+        print('''
+              The script needs 2 parameters:
+              1. The .dump file of the first router (result_1)
+              2. The .dump file of the second router (result_2)
+              Optional parameters, the defaults are taken from the merge section of the analysis.ini:
+              ip1=IP, ip2=IP      IPs of the smartphones behind the first and the second router
+              offset=SECONDS      clock offset of the second router, subtracted from its timestamps
+              gap=SECONDS         pause that starts a new burst of a flow
+              window=SECONDS      maximal delay between matched bursts
+              min_matches=N       matched bursts a flow pair needs to be listed
+              output=FILE         file for the flow pairs instead of the standard output
+              ''')
+        sys.exit(1)
+    direc = os.path.dirname(os.path.abspath(__file__))
+    config = ConfigParser.ConfigParser()
+    config.read(os.path.join(direc, 'analysis.ini'))
+    ipaddress = get_option(config, 'general', 'ip_address', '')
+    options = {'ip1': get_option(config, 'merge', 'ip1', ipaddress),
+               'ip2': get_option(config, 'merge', 'ip2', ipaddress),
+               'offset': get_option(config, 'merge', 'clock_offset', '0'),
+               'gap': get_option(config, 'merge', 'gap', '0.5'),
+               'window': get_option(config, 'merge', 'window', '2'),
+               'min_matches': get_option(config, 'merge', 'min_matches', '2'),
+               'output': ''}
+    for argument in sys.argv[3:]:
+        key, value = argument.split('=', 1)
+        if key not in options:
+            print('Unknown option ' + key)
+            sys.exit(1)
+        options[key] = value
+    ip_port_blacklist = blacklist.Blacklist(get_option(config, 'general', 'ip_blacklist', ''),
+                                            get_option(config, 'general', 'port_blacklist', ''))
+
+    matcher = Matcher(float(options['gap']), float(options['window']))
+    merged = heapq.merge(packets(sys.argv[1], 0, options['ip1'], 0.0, ip_port_blacklist),
+                         packets(sys.argv[2], 1, options['ip2'], float(options['offset']),
+                                 ip_port_blacklist))
+    for timestamp, side, triple, length in merged:
+        matcher.add(timestamp, side, triple, length)
+    rows = matcher.matches(int(options['min_matches']))
+
+    if options['output'] == '':
+        write(rows, sys.stdout)
+    else:
+        f = open(options['output'], 'w')
+        write(rows, f)
+        f.close()
+    sys.stderr.write('%d and %d flows, %d flow pairs\n' % (len(matcher.tables[0]),
+                                                          len(matcher.tables[1]), len(rows)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+On disk cache for the results of path measurements.
+The same remote node measures the paths to the same targets in many experiments.
+A result is cached for (node, protocol, IP, port) and reused until its time to live expired.
+The cache directory holds a copy of each cached result and an index file with
+the cached entries and the hit and miss counters of all runs.
+'''
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+
+INDEX = 'index.json'
+LOCK = 'index.lock'
+
+class PathCache():
+    '''
+    Cache with a time to live in seconds and a maximum number of entries.
+    If the cache is full, the least recently used (eviction: lru)
+    or the oldest entry (eviction: oldest) gets removed.
+    '''
+    def __init__(self, directory, ttl, max_entries, eviction='lru'):
+        self.directory = directory
+        self.ttl = float(ttl)
+        self.max_entries = int(max_entries)
+        self.eviction = eviction
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, node, triple):
+        '''
+        returns the key of a cache entry as string
+        '''
+        return node + ' ' + ' '.join([str(value) for value in triple])
+
+    def locked(self, function):
+        '''
+        Executes function(index) with the index file locked and stores the index afterwards.
+        Multiple analysis processes on one router share the cache.
+        '''
+        lock = open(os.path.join(self.directory, LOCK), 'w')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            filename = os.path.join(self.directory, INDEX)
+            index = {'entries': {}, 'hits': 0, 'misses': 0}
+            if os.path.exists(filename):
+                f = open(filename)
+                try:
+                    index = json.load(f)
+                except ValueError:
+                    print('The path cache index is damaged and gets rebuilt')
+                f.close()
+            result = function(index)
+            f = open(filename + '.tmp', 'w')
+            json.dump(index, f)
+            f.close()
+            os.rename(filename + '.tmp', filename)
+            return result
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    def remove(self, index, key):
+        '''
+        removes an entry and its result file from the cache
+        '''
+        entry = index['entries'].pop(key)
+        try:
+            os.remove(os.path.join(self.directory, entry['file']))
+        except OSError:
+            pass
+
+    def lookup(self, node, triple, filename):
+        '''
+        If a valid result is cached, it is linked or copied to filename and True is returned.
+        Otherwise the miss is counted and False is returned.
+        '''
+        key = self.key(node, triple)
+        def lookup_index(index):
+            entry = index['entries'].get(key)
+            if entry is not None and time.time() - entry['created'] > self.ttl:
+                self.remove(index, key)
+                entry = None
+            if entry is None:
+                index['misses'] = index['misses'] + 1
+                return False
+            source = os.path.join(self.directory, entry['file'])
+            try:
+                os.link(source, filename)
+            except OSError:
+                try:
+                    shutil.copyfile(source, filename)
+                except (IOError, OSError):
+                    self.remove(index, key)
+                    index['misses'] = index['misses'] + 1
+                    return False
+            entry['last_used'] = time.time()
+            index['hits'] = index['hits'] + 1
+            return True
+        hit = self.locked(lookup_index)
+        if hit:
+            self.hits = self.hits + 1
+        else:
+            self.misses = self.misses + 1
+        return hit
+
+    def store(self, node, triple, filename):
+        '''
+        Copies a new result into the cache and evicts entries if the cache is full
+        '''
+        key = self.key(node, triple)
+        name = hashlib.md5(key.encode('utf-8')).hexdigest() + '.txt'
+        def store_index(index):
+            if key in index['entries']:
+                self.remove(index, key)
+            shutil.copyfile(filename, os.path.join(self.directory, name))
+            now = time.time()
+            index['entries'][key] = {'file': name, 'created': now, 'last_used': now}
+            while len(index['entries']) > self.max_entries:
+                if self.eviction == 'oldest':
+                    field = 'created'
+                else:
+                    field = 'last_used'
+                victim = min(index['entries'], key=lambda k: index['entries'][k][field])
+                self.remove(index, victim)
+        self.locked(store_index)
+
+    def statistics(self):
+        '''
+        returns the hit and miss counters of this run as text
+        '''
+        total = self.hits + self.misses
+        rate = 0.0
+        if total > 0:
+            rate = 100.0 * self.hits / total
+        return 'path cache: %d hits, %d misses (%.1f%% hit rate)' % (self.hits, self.misses, rate)
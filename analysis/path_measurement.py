@@ -0,0 +1,239 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Path measurements from the remote nodes.
+The probes are executed over SSH on the remote node the traffic was tunneled through.
+To not pay the SSH handshake for every probe, one master connection is opened per remote node
+(OpenSSH connection multiplexing) and every probe runs as a new channel on this connection.
+Alternatively all probes are sent at once to a runner on the remote node (batch mode),
+that executes them in parallel and streams the results back over one SSH channel.
+'''
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+#Reads the runner source from the standard input and executes it on the remote node
+BOOTSTRAP = 'import sys;exec(sys.stdin.read(int(sys.stdin.readline())))'
+
+class SSHConnection():
+    '''
+    A multiplexed SSH connection to one remote node.
+    The master connection is established once with open(),
+    command() returns shell commands that run as channels on the master connection.
+    If the master connection could not be established,
+    the commands fall back to an own SSH connection each.
+    '''
+    def __init__(self, username, hostname, pkey, control_directory, multiplexing=True):
+        self.username = username
+        self.hostname = hostname
+        self.pkey = pkey
+        self.target = username + '@' + hostname
+        #The control socket path is limited in length, therefore a hash of the target is used
+        name = hashlib.md5(self.target.encode('utf-8')).hexdigest()[:16]
+        self.control_path = os.path.join(control_directory, name)
+        self.multiplexing = multiplexing
+        self.master = False
+
+    def open(self):
+        '''
+        Establishes the master connection in the background.
+        returns True if the master connection is available
+        '''
+        if not self.multiplexing or self.master:
+            return self.master
+        command = ['ssh', '-i', self.pkey, '-M', '-S', self.control_path, '-N', '-f',
+                   '-o', 'ControlPersist=yes', self.target]
+        devnull = open(os.devnull, 'r+')
+        try:
+            self.master = subprocess.call(command, stdin=devnull, stdout=devnull) == 0
+        except OSError:
+            self.master = False
+        devnull.close()
+        if not self.master:
+            print('No master connection to ' + self.hostname + ', every probe connects itself')
+        return self.master
+
+    def ssh(self, tty=False):
+        '''
+        returns the ssh part of a command line, e.g.:
+        ssh -S /tmp/abc/0123456789abcdef -i ~/.ssh/rsa_key user@hostname
+        '''
+        command = 'ssh '
+        if tty:
+            command = command + '-tt '
+        if self.master:
+            command = command + '-S ' + self.control_path + ' '
+        return command + '-i ' + self.pkey + ' ' + self.target
+
+    def command(self, remote_command, tty=False):
+        '''
+        returns a shell command that executes the remote command on the node:
+        echo "sudo traceroute -U -p 23 1.2.3.4 ; exit" | ssh -S ... user@hostname
+        '''
+        return 'echo "' + remote_command + ' ; exit" | ' + self.ssh(tty)
+
+    def close(self):
+        '''
+        Stops the master connection
+        '''
+        if self.master:
+            devnull = open(os.devnull, 'r+')
+            subprocess.call(['ssh', '-S', self.control_path, '-O', 'exit', self.target],
+                            stdin=devnull, stdout=devnull, stderr=devnull)
+            devnull.close()
+            self.master = False
+
+class SSHPool():
+    '''
+    Holds one multiplexed SSH connection per remote node.
+    '''
+    def __init__(self, multiplexing=True):
+        self.multiplexing = multiplexing
+        self.control_directory = tempfile.mkdtemp(prefix='matador-ssh-')
+        self.connections = {}
+
+    def get(self, username, hostname, pkey):
+        '''
+        returns the connection to a remote node and opens it if necessary
+        '''
+        key = (username, hostname, pkey)
+        if key not in self.connections:
+            connection = SSHConnection(username, hostname, pkey, self.control_directory,
+                                       self.multiplexing)
+            connection.open()
+            self.connections[key] = connection
+        return self.connections[key]
+
+    def close(self):
+        '''
+        Closes all master connections
+        '''
+        for connection in self.connections.values():
+            connection.close()
+        self.connections = {}
+        shutil.rmtree(self.control_directory, True)
+
+class BatchSession():
+    '''
+    Executes a list of probes with one remote command on the node.
+    The runner (remote_runner.py) is sent over the SSH channel together with the probes,
+    it runs as root, therefore neither a sudo per probe nor a pseudo terminal is necessary.
+    With local=True the runner is started on this machine instead, e.g. to test it.
+    '''
+    def __init__(self, connection, parallelism, remote_python='python', local=False):
+        self.connection = connection
+        self.parallelism = int(parallelism)
+        self.remote_python = remote_python
+        self.local = local
+
+    def command(self):
+        '''
+        returns the shell command that starts the runner
+        '''
+        runner = self.remote_python + " -c '" + BOOTSTRAP + "' " + str(self.parallelism)
+        if self.local:
+            return runner
+        return self.connection.ssh() + ' "sudo ' + runner + '"'
+
+    def run(self, probes, callback=None):
+        '''
+        Sends the probes to the runner and writes each result to the file of its probe
+        as soon as it arrives. callback(probe) is called for each result.
+        returns the probes without result, e.g. if the connection broke
+        '''
+        if len(probes) == 0:
+            return []
+        direc = os.path.dirname(os.path.abspath(__file__))
+        f = open(os.path.join(direc, 'remote_runner.py'))
+        source = f.read()
+        f.close()
+
+        by_identifier = {}
+        request = str(len(source)) + '\n' + source
+        for number, probe in enumerate(probes):
+            by_identifier[str(number)] = probe
+            request = request + str(number) + '\t' + probe.command + '\n'
+
+        devnull = open(os.devnull, 'w')
+        process = subprocess.Popen(self.command(),
+                                   shell=True,
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   stderr=devnull)
+        devnull.close()
+        #The runner reads the complete input before it writes the first result
+        process.stdin.write(request.encode('utf-8'))
+        process.stdin.close()
+        started = time.time()
+        while True:
+            header = process.stdout.readline()
+            if not header:
+                break
+            identifier, returncode, length = header.decode('ascii').split()
+            out = process.stdout.read(int(length))
+            probe = by_identifier.pop(identifier)
+            probe.started = started
+            probe.finished = time.time()
+            probe.returncode = int(returncode)
+            f = open(probe.filename + '.part', 'wb')
+            f.write(out)
+            f.close()
+            os.rename(probe.filename + '.part', probe.filename)
+            if callback is not None:
+                callback(probe)
+        process.wait()
+        missing = list(by_identifier.values())
+        if missing:
+            print('The batch on ' + self.connection.hostname + ' returned no result for ' +
+                  str(len(missing)) + ' probes')
+        return missing
+
+def probe(method, triple, in_application, sudo=True):
+    '''
+    returns the remote command of a path measurement to the target of a triple
+    and if a pseudo terminal is necessary.
+    in_application is None or a tuple (port_option, tcp_option, udp_option)
+    to measure the path with the protocol and port of the triple.
+    Without sudo the command has to be executed as root, e.g. by the batch runner.
+
+    TCP traceroutes require root rights. Some SSH configurations don't allow
+    fowarding commands as root wothout a Shell.
+    '-tt' requests a pseudo terminal.
+    Tests showed only even numbers of '-t' works.
+    '''
+    command = method + ' '
+    if sudo:
+        command = 'sudo ' + command
+    if in_application is None:
+        return command + str(triple[1]), False
+    port_option, tcp_option, udp_option = in_application
+    if triple[0] == 'UDP':
+        command = command + udp_option + ' ' + port_option + ' '
+        return command + str(triple[2]) + ' ' + str(triple[1]), False
+    command = command + tcp_option + ' ' + port_option + ' '
+    return command + str(triple[2]) + ' ' + str(triple[1]), True
+
+def result_name(triple, in_application, timestamp, label='_traceroute'):
+    '''
+    returns the end of the filename for the result of a path measurement, e.g.:
+    _traceroute_to_1.2.3.4_port_443_proto_TCP_at_01.02.3456_16:25:12.txt
+    '''
+    if in_application is None:
+        return label + '_to_' + str(triple[1]) + '_at_' + timestamp + '.txt'
+    name = label + '_to_' + str(triple[1]) + '_port_' + str(triple[2])
+    return name + '_proto_' + triple[0] + '_at_' + timestamp + '.txt'
@@ -0,0 +1,215 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Streaming reader for the .dump files written by tcpdump.
+The reader does not load the capture into memory but yields one record after another,
+therefore the memory usage stays the same for small and for very large captures.
+Only the classic pcap format is supported, that is the format tcpdump -w writes.
+The reader can follow a capture that is still written, like tail -f.
+A capture can be split into byte ranges that start at record boundaries,
+the records of each range can be read independently, e.g. in parallel processes.
+'''
+import os
+import struct
+import time
+
+#Magic numbers of the pcap file header: (byte order, nanosecond timestamps)
+MAGIC_NUMBERS = {b'\xd4\xc3\xb2\xa1': ('<', False),
+                 b'\xa1\xb2\xc3\xd4': ('>', False),
+                 b'\x4d\x3c\xb2\xa1': ('<', True),
+                 b'\xa1\xb2\x3c\x4d': ('>', True)}
+
+FILE_HEADER_LENGTH = 24
+RECORD_HEADER_LENGTH = 16
+#Upper bound for the original length of a packet (offloading creates packets above 64 kB)
+MAX_WIRELEN = 262144
+#Number of consecutive valid record headers that identify a record boundary
+CHAIN_LENGTH = 8
+
+class PcapException(Exception):
+    '''
+    Exception if a file is not a valid pcap file
+    '''
+    def __init__(self, value):
+        self.value = value
+    def __str__(self):
+        return repr(self.value)
+
+class PcapFile():
+    '''
+    Opens a pcap file and parses the file header.
+    The records are read lazily with the records() generator.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        header = self.file.read(FILE_HEADER_LENGTH)
+        if len(header) < FILE_HEADER_LENGTH or header[:4] not in MAGIC_NUMBERS:
+            self.file.close()
+            raise PcapException(filename + ' is not a pcap file')
+        self.endian, self.nanoseconds = MAGIC_NUMBERS[header[:4]]
+        self.snaplen, self.linktype = struct.unpack(self.endian + 'II', header[16:24])
+        self.record_header = struct.Struct(self.endian + 'IIII')
+
+    def seek(self, offset):
+        '''
+        continues reading at offset, which has to be the start of a record
+        '''
+        self.file.seek(offset)
+
+    def tell(self):
+        '''
+        returns the offset of the next record
+        '''
+        return self.file.tell()
+
+    def records(self, follow=None, interval=0.5, end=None):
+        '''
+        Generator, yields a triple for each record of the capture:
+        1. the timestamp as float
+        2. the original length of the packet on the wire
+        3. the captured bytes of the packet
+        A truncated record at the end of the file ends the generator,
+        e.g. if tcpdump got killed while writing.
+        If the function follow is given, the generator waits at the end of the file
+        for new records as long as follow() returns True and reads once more afterwards.
+        If end is given, the generator stops at the first record starting at or after end.
+        '''
+        divisor = 1000000000.0 if self.nanoseconds else 1000000.0
+        read = self.file.read
+        unpack = self.record_header.unpack
+        final = False
+        while True:
+            position = self.file.tell()
+            if end is not None and position >= end:
+                return
+            header = read(RECORD_HEADER_LENGTH)
+            if len(header) == RECORD_HEADER_LENGTH:
+                seconds, fraction, caplen, wirelen = unpack(header)
+                data = read(caplen)
+                if len(data) == caplen:
+                    yield seconds + fraction / divisor, wirelen, data
+                    continue
+            if follow is None or final:
+                return
+            #Waiting at the start of the incomplete record for the rest of it
+            self.file.seek(position)
+            if follow():
+                time.sleep(interval)
+            else:
+                final = True
+
+    def close(self):
+        '''
+        closes the underlying file
+        '''
+        self.file.close()
+
+    def valid_chain(self, data, position, size, reference):
+        '''
+        returns True if CHAIN_LENGTH valid record headers follow each other in data from position on
+        or the chain reaches the end of the file (size bytes, data ends there as well).
+        A header is valid if the lengths fit the snap length and the timestamp is plausible:
+        not before the first record and at most a year later, not decreasing by more than a second.
+        '''
+        divisor = 1000000000 if self.nanoseconds else 1000000
+        unpack_from = self.record_header.unpack_from
+        previous = reference
+        count = 0
+        while count < CHAIN_LENGTH:
+            if position == size:
+                return True
+            if position + RECORD_HEADER_LENGTH > len(data):
+                #A truncated record at the end of the file
+                return len(data) == size
+            seconds, fraction, caplen, wirelen = unpack_from(data, position)
+            if fraction >= divisor or caplen > self.snaplen or caplen > wirelen:
+                return False
+            if wirelen > MAX_WIRELEN or seconds < previous - 1 or seconds > reference + 31622400:
+                return False
+            previous = max(previous, seconds)
+            position = position + RECORD_HEADER_LENGTH + caplen
+            count = count + 1
+        return True
+
+    def boundary(self, offset):
+        '''
+        returns the offset of the first record boundary at or after offset,
+        or None if no boundary was found within the maximal length of a record
+        '''
+        size = os.fstat(self.file.fileno()).st_size
+        self.file.seek(FILE_HEADER_LENGTH)
+        header = self.file.read(RECORD_HEADER_LENGTH)
+        if len(header) < RECORD_HEADER_LENGTH:
+            return None
+        reference = self.record_header.unpack(header)[0]
+        record_length = RECORD_HEADER_LENGTH + min(self.snaplen, MAX_WIRELEN)
+        self.file.seek(offset)
+        #The data covers the search range and the complete chain of the last candidate
+        data = self.file.read(record_length * (CHAIN_LENGTH + 1))
+        last = min(record_length, len(data))
+        i = 0
+        while i < last:
+            if self.valid_chain(data, i, size - offset, reference):
+                return offset + i
+            i = i+1
+        return None
+
+def split(filename, parts):
+    '''
+    returns the offsets of record boundaries that split the records of a capture
+    into at most the given number of ranges of similar size:
+    [start of the first record, boundary, ..., size of the file]
+    '''
+    capture = PcapFile(filename)
+    try:
+        size = os.fstat(capture.file.fileno()).st_size
+        boundaries = [FILE_HEADER_LENGTH]
+        i = 1
+        while i < parts:
+            offset = capture.boundary(FILE_HEADER_LENGTH + (size - FILE_HEADER_LENGTH) * i // parts)
+            if offset is not None and offset > boundaries[-1] and offset < size:
+                boundaries.append(offset)
+            i = i+1
+        boundaries.append(size)
+    finally:
+        capture.close()
+    return boundaries
+
+def open_capture(filename, follow=None, interval=0.5):
+    '''
+    Opens a pcap file.
+    If the function follow is given, it waits until the file exists and holds the file header
+    as long as follow() returns True.
+    '''
+    while follow is not None:
+        if os.path.exists(filename) and os.path.getsize(filename) >= FILE_HEADER_LENGTH:
+            break
+        if not follow():
+            break
+        time.sleep(interval)
+    return PcapFile(filename)
+
+def read_records(filename):
+    '''
+    Generator, yields all records of a pcap file as (timestamp, wirelen, data)
+    and closes the file afterwards.
+    '''
+    capture = PcapFile(filename)
+    try:
+        for record in capture.records():
+            yield record
+    finally:
+        capture.close()
@@ -0,0 +1,80 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Runner for batched path measurements on the remote node.
+The analysis sends this file over the SSH channel, it is not installed on the node.
+It reads one probe per line from the standard input (identifier TAB command)
+until the input ends and executes the probes with a number of parallel workers.
+The result of each probe is written to the standard output as soon as it finished:
+a header line "identifier returncode length" followed by length bytes of output.
+Only the Python standard library is used, it runs with Python 2 and 3.
+'''
+import os
+import subprocess
+import sys
+import threading
+
+def main():
+    '''
+    The only parameter is the number of probes executed at the same time.
+    '''
+    parallelism = 8
+    if len(sys.argv) > 1:
+        parallelism = int(sys.argv[1])
+
+    probes = []
+    line = sys.stdin.readline()
+    while line:
+        line = line.rstrip('\n')
+        if line != '':
+            identifier, command = line.split('\t', 1)
+            probes.append((identifier, command))
+        line = sys.stdin.readline()
+
+    output = getattr(sys.stdout, 'buffer', sys.stdout)
+    lock = threading.Lock()
+
+    def worker():
+        '''
+        Takes probes from the list until it is empty and writes the framed results
+        '''
+        devnull = open(os.devnull, 'w')
+        while True:
+            lock.acquire()
+            if len(probes) == 0:
+                lock.release()
+                break
+            identifier, command = probes.pop(0)
+            lock.release()
+            process = subprocess.Popen(command, shell=True,
+                                       stdout=subprocess.PIPE,
+                                       stderr=devnull)
+            out = process.communicate()[0]
+            header = identifier + ' ' + str(process.returncode) + ' ' + str(len(out)) + '\n'
+            lock.acquire()
+            output.write(header.encode('ascii'))
+            output.write(out)
+            output.flush()
+            lock.release()
+        devnull.close()
+
+    workers = [threading.Thread(target=worker) for i in range(max(parallelism, 1))]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+if __name__ == '__main__':
+    main()
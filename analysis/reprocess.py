@@ -0,0 +1,223 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+The script analyses the stored .dump files of all applications again,
+e.g. after the blacklist or the flow extraction changed.
+It walks the subdirectories of the storage directory (whatsapp/, wechat/, ...)
+and distributes the captures over a pool of processes, one per core by default.
+A capture is skipped if its outputs are up to date:
+1. mtime (default): the flow summary is newer than the capture, analysis.ini and the analysis code
+2. hash: the SHA-1 of the capture and of analysis.ini and the code did not change since the last run,
+   the hashes are stored in reprocess_state.json in the storage directory
+Only captures of this router (identifier in analysis.ini) are analysed.
+By default no new path measurements are made, the results of the first analysis are kept.
+'''
+import ConfigParser
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+import analysis
+
+STATE = 'reprocess_state.json'
+
+def parse_name(filename):
+    '''
+    returns [counter, identifier, application, country, hostname] of a capture filename, e.g.
+    0001_1_whatsapp_DE_node.example_tcpdump_to_BR_other.example_2015_06_01_12:00:00.dump
+    or None if the file is no capture of the framework
+    '''
+    if not filename.endswith('.dump') or '_tcpdump_to_' not in filename:
+        return None
+    fields = filename.split('_tcpdump_to_')[0].split('_', 4)
+    if len(fields) != 5:
+        return None
+    return fields
+
+def file_hash(filename):
+    '''
+    returns the SHA-1 of a file, read in blocks of 1 MB
+    '''
+    digest = hashlib.sha1()
+    f = open(filename, 'rb')
+    block = f.read(1048576)
+    while block:
+        digest.update(block)
+        block = f.read(1048576)
+    f.close()
+    return digest.hexdigest()
+
+def code_fingerprint(direc, check):
+    '''
+    returns the fingerprint of analysis.ini and the analysis code:
+    the newest modification time (mtime) or the SHA-1 of all files (hash)
+    '''
+    files = sorted([name for name in os.listdir(direc)
+                    if name.endswith('.py') or name == 'analysis.ini'])
+    if check == 'mtime':
+        return max([os.path.getmtime(os.path.join(direc, name)) for name in files])
+    digest = hashlib.sha1()
+    for name in files:
+        digest.update(name.encode('utf-8'))
+        digest.update(file_hash(os.path.join(direc, name)).encode('ascii'))
+    return digest.hexdigest()
+
+def process(job):
+    '''
+    Analyses one capture in a process of the pool, if its outputs are not up to date.
+    returns (job, status, capture hash, seconds, error) with the status analysed, skipped or failed
+    '''
+    directory, capture, fields, prefix, check, code, known, force, paths = job
+    started = time.time()
+    digest = None
+    output = prefix + '_flows.txt'
+    if check == 'hash':
+        digest = file_hash(directory + capture)
+    if not force and os.path.exists(output):
+        if check == 'mtime':
+            newest = max(os.path.getmtime(directory + capture), code)
+            if os.path.getmtime(output) > newest:
+                return job, 'skipped', digest, time.time() - started, None
+        elif known == [digest, code]:
+            return job, 'skipped', digest, time.time() - started, None
+    counter, identifier, application, country, hostname = fields
+    try:
+        analysis.analyze(directory, capture, country, hostname, application, counter, False, paths)
+    except Exception as error:
+        return job, 'failed', digest, time.time() - started, repr(error)
+    return job, 'analysed', digest, time.time() - started, None
+
+def write_state(filename, state):
+    '''
+    Stores the hashes of the analysed captures
+    '''
+    f = open(filename + '.tmp', 'w')
+    json.dump(state, f)
+    f.close()
+    os.rename(filename + '.tmp', filename)
+
+def main():
+    '''
+    The script needs 1 parameter:
+    1. The storage directory with one subdirectory per application
+    Optional parameters:
+    processes=N   number of processes (default: number of cores)
+    check=hash    compare hashes instead of modification times
+    force=True    analyse all captures again
+    paths=True    make new path measurements
+    '''
+    if len(sys.argv) < 2 or not os.path.isdir(sys.argv[1]):
+        print('''
+              The script needs 1 parameter:
+              1. The storage directory with one subdirectory per application
+              Optional parameters:
+              processes=N   number of processes (default: number of cores)
+              check=hash    compare hashes instead of modification times
+              force=True    analyse all captures again
+              paths=True    make new path measurements
+              ''')
+        sys.exit(1)
+    storage = os.path.join(sys.argv[1], '')
+    options = {'processes': str(multiprocessing.cpu_count()), 'check': 'mtime',
+               'force': 'False', 'paths': 'False'}
+    for argument in sys.argv[2:]:
+        key, value = argument.split('=', 1)
+        if key not in options:
+            print('Unknown option ' + key)
+            sys.exit(1)
+        options[key] = value
+    check = options['check']
+    if check not in ['mtime', 'hash']:
+        print('check has to be mtime or hash')
+        sys.exit(1)
+
+    direc = os.path.dirname(os.path.abspath(__file__))
+    config = ConfigParser.ConfigParser()
+    config.read(os.path.join(direc, 'analysis.ini'))
+    identifier = config.get('general', 'identifier', 0)
+    code = code_fingerprint(direc, check)
+
+    state_file = os.path.join(storage, STATE)
+    state = {}
+    if check == 'hash' and os.path.exists(state_file):
+        f = open(state_file)
+        state = json.load(f)
+        f.close()
+
+    '''
+    One job per capture of this router, the largest captures are started first
+    so that no large capture is left for the end of the run.
+    '''
+    jobs = []
+    others = 0
+    for application in sorted(os.listdir(storage)):
+        directory = os.path.join(storage, application, '')
+        if not os.path.isdir(directory):
+            continue
+        for capture in os.listdir(directory):
+            fields = parse_name(capture)
+            if fields is None:
+                continue
+            if fields[1] != identifier:
+                others = others + 1
+                continue
+            prefix = directory + fields[0] + '_' + identifier + '_' + fields[2] + '_'
+            prefix = prefix + fields[3] + '_' + fields[4]
+            jobs.append((directory, capture, fields, prefix, check, code,
+                         state.get(directory + capture), options['force'] == 'True',
+                         options['paths'] == 'True'))
+    jobs.sort(key=lambda job: os.path.getsize(job[0] + job[1]), reverse=True)
+    if others > 0:
+        print(str(others) + ' captures of other routers are ignored')
+
+    pool = multiprocessing.Pool(int(options['processes']))
+    started = time.time()
+    counts = {'analysed': 0, 'skipped': 0, 'failed': 0}
+    megabytes = 0.0
+    done = 0
+    try:
+        for job, status, digest, seconds, error in pool.imap_unordered(process, jobs):
+            done = done + 1
+            counts[status] = counts[status] + 1
+            if status == 'analysed':
+                megabytes = megabytes + os.path.getsize(job[0] + job[1]) / 1048576.0
+            if status == 'failed':
+                print('[%d/%d] failed %s: %s' % (done, len(jobs), job[1], error))
+            elif status == 'analysed':
+                print('[%d/%d] analysed %s in %.1f s' % (done, len(jobs), job[1], seconds))
+            if check == 'hash' and status != 'failed':
+                state[job[0] + job[1]] = [digest, code]
+                if done % 50 == 0:
+                    write_state(state_file, state)
+    except:
+        pool.terminate()
+        raise
+    finally:
+        if check == 'hash':
+            write_state(state_file, state)
+    pool.close()
+    pool.join()
+
+    elapsed = max(time.time() - started, 0.001)
+    print('%d analysed, %d skipped, %d failed in %.1f s' % (counts['analysed'], counts['skipped'],
+                                                           counts['failed'], elapsed))
+    print('%.2f captures/s, %.2f MB/s' % (counts['analysed'] / elapsed, megabytes / elapsed))
+    if counts['failed'] > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
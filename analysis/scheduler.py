@@ -0,0 +1,160 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Scheduler for parallel path measurements.
+The number of probes running at the same time on one remote node is limited
+and the start rate of new probes is limited by a token bucket.
+The output of each probe is written directly into its result file,
+the file gets its final name as soon as the probe has finished.
+'''
+import os
+import subprocess
+import time
+
+class TokenBucket():
+    '''
+    Token bucket with a fill rate in tokens per second and a maximum number of tokens.
+    A rate of 0 disables the limit.
+    '''
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(float(burst), 1.0)
+        self.tokens = self.burst
+        self.last = time.time()
+
+    def refill(self):
+        '''
+        adds the tokens for the time since the last refill
+        '''
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def take(self):
+        '''
+        takes a token and returns True if one is available
+        '''
+        if self.rate <= 0:
+            return True
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens = self.tokens - 1
+            return True
+        return False
+
+    def delay(self):
+        '''
+        returns the time in seconds until the next token is available
+        '''
+        if self.rate <= 0:
+            return 0
+        self.refill()
+        return max(0, (1 - self.tokens) / self.rate)
+
+class Probe():
+    '''
+    A path measurement: the shell command, the node it runs on and the result file.
+    '''
+    def __init__(self, node, command, filename, data=None):
+        self.node = node
+        self.command = command
+        self.filename = filename
+        self.data = data
+        self.process = None
+        self.output = None
+        self.returncode = None
+        self.started = None
+        self.finished = None
+
+class Scheduler():
+    '''
+    Runs the submitted probes with at most max_concurrent probes per node at the same time.
+    callback(probe) is called for each probe as soon as it finished and its result file is written.
+    '''
+    def __init__(self, max_concurrent, rate, burst, callback=None, interval=0.05):
+        self.max_concurrent = max(int(max_concurrent), 1)
+        self.bucket = TokenBucket(rate, burst)
+        self.callback = callback
+        self.interval = interval
+        self.pending = []
+        self.running = []
+        self.finished = []
+
+    def submit(self, probe):
+        '''
+        adds a probe to the queue, it is started by run() or poll()
+        '''
+        self.pending = self.pending + [probe]
+
+    def running_on(self, node):
+        '''
+        returns the number of probes running on a node
+        '''
+        return len([probe for probe in self.running if probe.node == node])
+
+    def start(self, probe):
+        '''
+        Starts a probe, the output is written into a temporary file next to the result file
+        '''
+        probe.output = open(probe.filename + '.part', 'w')
+        devnull = open(os.devnull, 'w')
+        probe.process = subprocess.Popen(probe.command,
+                                         shell=True,
+                                         stdout=probe.output,
+                                         stderr=devnull)
+        devnull.close()
+        probe.started = time.time()
+        self.running = self.running + [probe]
+
+    def finish(self, probe):
+        '''
+        Closes the output of a finished probe and moves it to the result file
+        '''
+        probe.returncode = probe.process.returncode
+        probe.finished = time.time()
+        probe.output.close()
+        os.rename(probe.filename + '.part', probe.filename)
+        self.running.remove(probe)
+        self.finished = self.finished + [probe]
+        if self.callback is not None:
+            self.callback(probe)
+
+    def poll(self):
+        '''
+        Collects finished probes and starts pending probes as far as the limits allow.
+        returns True while probes are pending or running
+        '''
+        for probe in list(self.running):
+            if probe.process.poll() is not None:
+                self.finish(probe)
+        for probe in list(self.pending):
+            if self.running_on(probe.node) >= self.max_concurrent:
+                continue
+            if not self.bucket.take():
+                break
+            self.pending.remove(probe)
+            self.start(probe)
+        return len(self.pending) + len(self.running) > 0
+
+    def run(self):
+        '''
+        Waits actively until all submitted probes have finished
+        '''
+        while self.poll():
+            if self.pending and len(self.running) == 0:
+                time.sleep(max(self.interval, self.bucket.delay()))
+            else:
+                time.sleep(self.interval)
+        return self.finished
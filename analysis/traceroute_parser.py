@@ -0,0 +1,136 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Parser for the output of traceroute.
+A hop line starts with the hop number followed by the probes, for example:
+ 1  10.1.1.1  1.123 ms  1.001 ms  0.998 ms
+ 2  router.example.com (10.2.2.2)  5.1 ms * 10.2.2.3 (10.2.2.3)  5.3 ms
+ 3  * * *
+Each probe is a time in ms or a '*', an address is given before its first probe.
+Annotations like !H or !N are ignored.
+parse() returns the responding addresses of each hop, probes() every single probe.
+'''
+import collections
+
+def probe_line(line):
+    '''
+    returns the probes of one line as a list of (hop, address, rtt) in the order of the output.
+    A probe without reply ('*') is returned as (hop, None, None).
+    If the line is no hop line, an empty list is returned.
+    '''
+    tokens = line.split()
+    if len(tokens) == 0 or not tokens[0].isdigit():
+        return []
+    hop = int(tokens[0])
+    probes = []
+    address = None
+    i = 1
+    while i < len(tokens):
+        token = tokens[i]
+        if token == '*':
+            probes = probes + [(hop, None, None)]
+            i = i+1
+        elif token.startswith('!'):
+            i = i+1
+        elif i+1 < len(tokens) and tokens[i+1] == 'ms':
+            try:
+                rtt = float(token)
+            except ValueError:
+                rtt = None
+            if address is not None and rtt is not None:
+                probes = probes + [(hop, address, rtt)]
+            i = i+2
+        elif i+1 < len(tokens) and tokens[i+1].startswith('(') and tokens[i+1].endswith(')'):
+            #hostname (IP)
+            address = tokens[i+1][1:-1]
+            i = i+2
+        else:
+            #only the IP with traceroute -n
+            address = token.strip('()')
+            i = i+1
+    return probes
+
+def parse_line(line):
+    '''
+    returns the hops of one line as a list of (hop, address, rtt, replies),
+    one entry per responding address with the minimal round trip time in ms.
+    A hop without replies is returned as (hop, None, None, 0).
+    If the line is no hop line, an empty list is returned.
+    '''
+    probes = probe_line(line)
+    if len(probes) == 0:
+        tokens = line.split()
+        if len(tokens) == 0 or not tokens[0].isdigit():
+            return []
+        return [(int(tokens[0]), None, None, 0)]
+    rtts = collections.OrderedDict()
+    for hop, address, rtt in probes:
+        if address is not None:
+            rtts[address] = rtts.get(address, []) + [rtt]
+    if len(rtts) == 0:
+        return [(probes[0][0], None, None, 0)]
+    return [(probes[0][0], address, min(values), len(values)) for address, values in rtts.items()]
+
+def probes(output):
+    '''
+    returns all probes of a traceroute output as a list of (hop, address, rtt)
+    '''
+    if isinstance(output, bytes):
+        output = output.decode('utf-8', 'replace')
+    result = []
+    for line in output.splitlines():
+        result.extend(probe_line(line))
+    return result
+
+def parse(output):
+    '''
+    returns all hops of a traceroute output as a list of (hop, address, rtt, replies)
+    '''
+    if isinstance(output, bytes):
+        output = output.decode('utf-8', 'replace')
+    hops = []
+    for line in output.splitlines():
+        hops = hops + parse_line(line)
+    return hops
+
+def read_file(filename):
+    '''
+    returns the content of a result file or None if the file does not exist
+    '''
+    try:
+        f = open(filename, 'rb')
+    except IOError:
+        return None
+    output = f.read()
+    f.close()
+    return output
+
+def parse_file(filename):
+    '''
+    returns all hops of a result file, or an empty list if the file does not exist
+    '''
+    output = read_file(filename)
+    if output is None:
+        return []
+    return parse(output)
+
+def probes_file(filename):
+    '''
+    returns all probes of a result file, or an empty list if the file does not exist
+    '''
+    output = read_file(filename)
+    if output is None:
+        return []
+    return probes(output)
@@ -20,7 +20,10 @@ import signal
 import paramiko
 import configparser
 import os
+import threading
 import time
+import probes
+import steps
 
 class Host1Exception(Exception):
     '''
@@ -98,6 +101,13 @@ def force_stop(config, ssh_worker):
     Sometimes the network components did not close propery,
     this function calls scripts that check the correct tear down and force it if necessary
     '''
+    force_stop_1(config)
+    force_stop_2(config, ssh_worker)
+
+def force_stop_1(config):
+    '''
+    Checks the tear down of the tunnel of the first router and forces it if necessary
+    '''
     command = config['network_tear_down_1']['command']
     try:
         subprocess.check_call(command,
@@ -105,68 +115,334 @@ def force_stop(config, ssh_worker):
     except:
         raise FatalException('Can not tear down the tunnel')
 
+def force_stop_2(config, ssh_worker):
+    '''
+    Checks the tear down of the tunnel of the second router and forces it if necessary
+    '''
     command = config['network_tear_down_2']['command']
     try:
         ssh_worker.exec_command(command)
     except:
         raise FatalException('Can not tear down the tunnel')
 
-def experiment(countries, hostnames, coordinates, counter, storage_directory):
-    '''
-    An experiment executes all necessary steps.
-    1. network setup
-    2. location setup
-    3. measurement setup
-    4. app execution
-    5. data analysis
-    6. result backup
-    7. clean up
-    '''
-    direc = os.path.dirname(__file__)
-    if direc != '':
-        direc = direc + '/'
+class Session():
+    '''
+    The connection to the second router and the tunnels of both routers of consecutive experiments.
+    The wrapper keeps the first hostname for a whole row of its matrix,
+    with keep_tunnels a tunnel whose hostname did not change and that still works
+    is used by the next experiment instead of being torn down and set up again.
+    Only the side whose hostname changed is replaced.
+    Without keep_tunnels both tunnels are closed after each experiment as before.
+    '''
+    def __init__(self):
+        direc = os.path.dirname(__file__)
+        if direc != '':
+            direc = direc + '/'
+
+        self.config = configparser.ConfigParser()
+        self.config.read(direc + 'controller.ini')
+        self.keep = self.config['general'].get('keep_tunnels', 'False') == 'True'
+        self.ssh_worker = None
+        self.connect()
+
+        #Hostname and network setup (local process, ssh channel) of both tunnels
+        self.hostnames = [None, None]
+        self.networks = [None, None]
+        #Sides set up again by the last start
+        self.rebuilt = []
+        prober = probes.Prober(self.config)
+        self.dns_check = prober.option('dns_check', 'ip netns exec tunnel dig +time=2 +tries=1 '
+                                                    '+short google.de | grep -q .')
+
+    def connect(self):
+        '''
+        The second router of the setup is controlled over SSH.
+        All necessary parameters are in the controller.ini file.
+        Pramiko is used for the ssh connection to the second router.
+        '''
+        worker = self.config['general']['worker']
+        private_key = paramiko.RSAKey.from_private_key_file(self.config[worker]['pkey'])
+        username = self.config[worker]['username']
+        ipaddress = self.config[worker]['ip']
+        self.ssh_worker = paramiko.SSHClient()
+        self.ssh_worker.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.ssh_worker.connect(ipaddress, username=username, password='', pkey=private_key)
+
+    def check_connection(self):
+        '''
+        The connection is used by many experiments, it may drop in between,
+        e.g. after a reboot of the second router or a timeout.
+        A dropped connection is opened again. The tunnel of the second router
+        was set up over the old connection and is not kept.
+        '''
+        transport = self.ssh_worker.get_transport()
+        if transport is not None and transport.is_active():
+            return
+        print('The connection to the second router was lost and gets opened again')
+        self.ssh_worker.close()
+        try:
+            self.connect()
+        except Exception as error:
+            raise FatalException('The second router can not be reached: ' + str(error))
+        self.hostnames[1] = None
 
-    config = configparser.ConfigParser()
-    config.read(direc + 'controller.ini')
+    def running(self, side):
+        '''
+        returns True if the network setup of a side is still running
+        '''
+        network = self.networks[side]
+        if network is None:
+            return False
+        if side == 0:
+            return network.poll() is None
+        return not network.exit_status_ready()
+
+    def healthy(self, side):
+        '''
+        returns True if the tunnel of a side is running and a DNS query through it succeeds
+        '''
+        if not self.running(side):
+            return False
+        if side == 0:
+            return probes.command_check(self.dns_check)()
+        return probes.remote_check(self.ssh_worker, self.dns_check)()
 
-    '''
-    The second router of the setup is controlled over SSH.
-    All necessary parameters are in the controller.ini file.
-    Pramiko is used for the ssh connection to the second router.
-    '''
-    worker = config['general']['worker']
-    private_key = paramiko.RSAKey.from_private_key_file(config[worker]['pkey'])
-    username = config[worker]['username']
-    ipaddress = config[worker]['ip']
-    ssh_worker = paramiko.SSHClient()
-    ssh_worker.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh_worker.connect(ipaddress, username=username, password='', pkey=private_key)
-    time.sleep(2)
+    def start(self, hostnames):
+        '''
+        Starts the network setup of each side whose hostname changed or whose tunnel does not work.
+        returns the sides that were set up again
+        '''
+        self.check_connection()
+        rebuilt = []
+        self.rebuilt = rebuilt
+        for side in [0, 1]:
+            if self.keep and self.hostnames[side] == hostnames[side] and self.healthy(side):
+                print('The tunnel to ' + hostnames[side] + ' is kept')
+                continue
+            self.stop_side(side)
+            if side == 0:
+                '''
+                The network setup is done localy with a subprocess.
+                '''
+                command = self.config['network_setup_1']['command'] + ' ' + hostnames[0]
+                network = subprocess.Popen(command,
+                                           shell=True,
+                                           stderr=subprocess.PIPE,
+                                           preexec_fn=os.setsid)
+            else:
+                '''
+                The network setup on the second router is made on over SSH.
+                A new Paramiko session is opend and the get_pty() method used
+                to get a tty.
+                Whenever the connection to the second router gets interrupted or closed,
+                all process sartet in the tty session receive a SIGHUP signal.
+                '''
+                command = self.config['network_setup_2']['command'] + ' ' + hostnames[1]
+                network = self.ssh_worker.get_transport().open_session()
+                network.get_pty()
+                network.exec_command(command)
+            self.networks[side] = network
+            self.hostnames[side] = hostnames[side]
+            rebuilt.append(side)
+        return rebuilt
+
+    def stop_side(self, side):
+        '''
+        Closes the network setup of a side and forces the tear down of its tunnel
+        '''
+        if self.networks[side] is None:
+            return
+        if side == 0:
+            clean_up([self.networks[0]], [])
+        else:
+            clean_up([], [self.networks[1]])
+        self.networks[side] = None
+        self.hostnames[side] = None
+        if side == 0:
+            force_stop_1(self.config)
+        else:
+            force_stop_2(self.config, self.ssh_worker)
+
+    def stop(self):
+        '''
+        Closes both tunnels, e.g. after an error
+        '''
+        self.stop_side(0)
+        self.stop_side(1)
 
+    def release(self):
+        '''
+        Called at the end of an experiment, closes both tunnels unless they are kept
+        '''
+        if not self.keep:
+            self.stop()
 
-    '''
-    The network setup is done localy with a subprocess.
-    '''
-    command = config['network_setup_1']['command'] + ' ' + hostnames[0]
-    setup_network_1 = subprocess.Popen(command,
-                                       shell=True,
-                                       stderr=subprocess.PIPE,
-                                       preexec_fn=os.setsid)
+    def close(self):
+        '''
+        Closes both tunnels and the connection to the second router
+        '''
+        self.stop()
+        self.ssh_worker.close()
+
+def start_analysis(config, ssh_worker, directory, results, countries, hostnames, app, counter,
+                   follow=False):
+    '''
+    Starts the analysis scripts of both .dump files, locally and on the second router.
+    With follow=True the scripts analyse the .dump files while they are still written,
+    they finish as soon as the done markers exist (see mark_done).
+    returns the local process and the ssh channel of the second router
+    '''
+    suffix = ''
+    if follow:
+        suffix = ' follow'
+    command = config['analysis_1']['command'] + ' ' + directory + ' '
+    command = command + results[0] + ' ' + countries[0]+ ' ' +hostnames[0] + ' ' + app + ' '
+    command = command + counter + suffix
+
+    analysis_1 = subprocess.Popen(command,
+                                  shell=True,
+                                  stderr=subprocess.PIPE,
+                                  preexec_fn=os.setsid)
+
+    command = config['analysis_2']['command']+ ' ' + directory + ' '
+    command = command + results[1] + ' ' + countries[1] + ' ' +hostnames[1] + ' ' + app + ' '
+    command = command + counter + suffix
+    analysis_2 = ssh_worker.get_transport().open_session()
+    analysis_2.get_pty()
+    analysis_2.exec_command(command)
+    return analysis_1, analysis_2
+
+def stop_remote(channel, timeout=30):
+    '''
+    Interrupts the process of an ssh channel with a pty (Ctrl-C) and waits until it ended,
+    e.g. until tcpdump wrote the last packets. After the timeout the channel is closed.
+    returns True if the process ended in time
+    '''
+    if not channel.exit_status_ready():
+        try:
+            channel.send('\x03')
+        except Exception:
+            pass
+    deadline = time.time() + timeout
+    while not channel.exit_status_ready() and time.time() < deadline:
+        time.sleep(0.1)
+    if not channel.exit_status_ready():
+        channel.close()
+        return False
+    channel.recv_exit_status()
+    return True
+
+def mark_done(ssh_worker, directory, results):
+    '''
+    Creates the done markers of both .dump files after tcpdump was terminated,
+    the online analysis reads the rest of the file and continues with the path measurements.
+    returns False if the marker on the second router could not be created
+    '''
+    f = open(directory + results[0] + '.done', 'w')
+    f.close()
+    stdin, stdout, stderr = ssh_worker.exec_command('touch ' + directory + results[1] + '.done')
+    if stdout.channel.recv_exit_status() != 0:
+        print('The done marker of ' + results[1] + ' could not be created: ' +
+              stderr.read().decode('utf-8', 'replace').strip())
+        return False
+    return True
+
+class AnalysisQueue():
+    '''
+    The analyses of the applications of one experiment.
+    The analysis scripts of an application keep running in the background
+    while the next application is measured, a thread per application waits for both of them.
+    At most max_pending applications are analysed at the same time,
+    with max_pending 1 each analysis is finished before the next application starts.
+    The analyses are recorded in the timeline of the experiment, if one is given.
+    '''
+    def __init__(self, max_pending, timeline=None):
+        self.max_pending = max(max_pending, 1)
+        self.timeline = timeline
+        self.pending = []
+        #(application, router) of each failed analysis
+        self.failures = []
+        self.lock = threading.Lock()
+
+    def add(self, app, analysis_1, analysis_2):
+        '''
+        Adds the analysis scripts of an application, both routers,
+        and waits for the oldest application if too many are analysed
+        '''
+        thread = threading.Thread(target=self.wait_for, args=(app, analysis_1, analysis_2))
+        thread.start()
+        self.pending = self.pending + [(app, thread, analysis_1, analysis_2)]
+        while len(self.pending) >= self.max_pending:
+            self.pending.pop(0)[1].join()
+
+    def wait_for(self, app, analysis_1, analysis_2):
+        '''
+        Waits for the analysis scripts of an application and remembers the failed ones
+        '''
+        start = time.time()
+        status = 'done'
+        stdout, stderr = analysis_1.communicate()
+        if analysis_1.returncode != 0:
+            self.failed(app, '1', stderr)
+            status = 'failed'
+        if analysis_2.recv_exit_status() != 0:
+            self.failed(app, '2', b'')
+            status = 'failed'
+        if self.timeline is not None:
+            self.timeline.record('analysis_' + app, start, time.time(), status,
+                                 ['router1', 'router2'])
+
+    def failed(self, app, router, stderr):
+        '''
+        Records a failed analysis and prints the last error output of it
+        '''
+        with self.lock:
+            self.failures = self.failures + [(app, router)]
+        message = 'The analysis of ' + app + ' on router ' + router + ' failed'
+        if stderr:
+            message = message + ': ' + stderr.decode('utf-8', 'replace').strip()[-500:]
+        print(message)
+
+    def failed_apps(self):
+        '''
+        returns the applications with a failed analysis so far
+        '''
+        with self.lock:
+            failures = self.failures
+        apps = []
+        for app, router in failures:
+            if app not in apps:
+                apps = apps + [app]
+        return apps
+
+    def join(self):
+        '''
+        Waits for all outstanding analyses and returns the applications whose analysis failed
+        '''
+        for app, thread, analysis_1, analysis_2 in self.pending:
+            thread.join()
+        self.pending = []
+        return self.failed_apps()
 
+    def stop(self):
+        '''
+        Terminates all outstanding analyses
+        '''
+        clean_up([pending[2] for pending in self.pending], [pending[3] for pending in self.pending])
+        self.join()
+
+def check_worker(ssh_worker, prober):
     '''
-    The network setup on the second router is made on over SSH.
-    A new Paramiko session is opend and the get_pty() method used
-    to get a tty.
-    Whenever the connection to the second router gets interrupted or closed,
-    all process sartet in the tty session receive a SIGHUP signal.
+    Step: waits until the second router answers over SSH
     '''
-    command = config['network_setup_2']['command'] + ' ' + hostnames[1]
-    setup_network_2 = ssh_worker.get_transport().open_session()
-    setup_network_2.get_pty()
-    setup_network_2.exec_command(command)
+    try:
+        prober.wait('worker', probes.remote_check(ssh_worker, 'true'), 'worker_deadline', '30')
+    except probes.ProbeException as error:
+        raise FatalException('The second router does not respond: ' + str(error))
 
+def location_setup(config, countries, hostnames, coordinates, counter, storage_directory):
     '''
-    The Xprivacy settings get changed on the smartphones.
+    Step: the Xprivacy settings get changed on the smartphones.
     The process gets filmed addtionally.
     1. Create Filenames
     2. start Xprivacy change script with the coodinates and the filenames
@@ -185,46 +461,171 @@ def experiment(countries, hostnames, coordinates, counter, storage_directory):
     except:
         raise FatalException('The smartphones are not working')
 
-    #To make sure, the tunnels are established even to slower nodes, a timeout is waited.
-    time.sleep(100)
+def wait_tunnel(session, prober, side, aborted):
+    '''
+    Step: the tunnel of a side is ready as soon as the tun device is up in the tunnel namespace
+    and a DNS query through it succeeds. Slower nodes get time up to the tunnel deadline,
+    a tunnel whose setup ended is not waited for, neither after another step failed (aborted).
+    Kept tunnels were already checked when the session decided to keep them.
+    '''
+    if side not in session.rebuilt:
+        return
+    tunnel_check = prober.option('tunnel_check',
+                                 'ip netns exec tunnel ip -o link show up | grep -q tun')
+    dns_check = prober.option('dns_check',
+                              'ip netns exec tunnel dig +time=2 +tries=1 +short google.de | grep -q .')
+    network = session.networks[side]
+    if side == 0:
+        tunnel_probe = probes.command_check(tunnel_check)
+        dns_probe = probes.command_check(dns_check)
+        ended = lambda: network.poll() is not None or aborted()
+    else:
+        tunnel_probe = probes.remote_check(session.ssh_worker, tunnel_check)
+        dns_probe = probes.remote_check(session.ssh_worker, dns_check)
+        ended = lambda: network.exit_status_ready() or aborted()
+    number = str(side + 1)
+    try:
+        prober.wait('tunnel_' + number, tunnel_probe, 'tunnel_deadline', '300', ended)
+        prober.wait('dns_' + number, dns_probe, 'dns_deadline', '60', ended)
+    except probes.ProbeException as error:
+        print(error)
+        if side == 0:
+            raise Host1Exception('Host1 does not work')
+        raise Host2Exception('Host2 does not work')
+
+def network_check(session, side):
+    '''
+    Step: the network check script of a side gets executed after its tunnel was set up again
+    '''
+    if side not in session.rebuilt:
+        return
+    if side == 0:
+        command = session.config['network_check_1']['command']
+        try:
+            subprocess.check_call(command, shell=True)
+        except Exception as error:
+            print(error)
+            raise Host1Exception('Host1 does not work')
+    else:
+        command = session.config['network_check_2']['command']
+        check_2 = session.ssh_worker.get_transport().open_session()
+        check_2.get_pty()
+        check_2.exec_command(command)
+        if check_2.recv_exit_status() != 0:
+            raise Host2Exception('Host2 does not work')
 
+def save(config, ssh_worker, side, counter):
     '''
-    Afterwards the network check script get executed on both routers
-    and Exceptions raised if necessary.
+    Step: the results of a router get copied to a more reliable storage server.
+    '''
+    if side == 0:
+        command = config['save_1']['command']
+        try:
+            subprocess.check_call(command, shell=True)
+        except:
+            raise SmallException('Mob2 could not copy to the server on step ' + counter)
+    else:
+        command = config['save_2']['command']
+        try:
+            ssh_worker.exec_command(command)
+        except:
+            raise SmallException('Mob1 could not copy to the server on step ' + counter)
+
+def experiment(countries, hostnames, coordinates, counter, storage_directory, session=None):
     '''
-    command = config['network_check_1']['command']
+    An experiment executes all necessary steps.
+    1. network setup
+    2. location setup
+    3. measurement setup
+    4. app execution
+    5. data analysis
+    6. result backup
+    7. clean up
+    A Session of the wrapper keeps the tunnels to unchanged hostnames for the next experiment,
+    without a session the connection and both tunnels are closed at the end.
+    '''
+    own_session = session is None
+    if own_session:
+        session = Session()
+    config = session.config
+    session.check_connection()
+    ssh_worker = session.ssh_worker
+    #The online analysis starts together with tcpdump and analyses the capture while it grows
+    online = config['general'].get('online_analysis', 'False') == 'True'
+    #The analysis of an application runs while the next applications are measured
+    max_pending = 1
+    if config['general'].get('pipelined_analysis', 'False') == 'True':
+        max_pending = int(config['general'].get('max_pending_analyses', '2')) + 1
+
+    '''
+    Instead of fixed sleeps the controller waits for readiness probes (see probes.py),
+    each with its own deadline. The waiting times are printed and logged.
+    '''
+    label = counter + ' ' + hostnames[0] + ' ' + hostnames[1]
+    prober = probes.Prober(config, label)
+
+    '''
+    The setup is a dependency graph of steps (see steps.py), each step starts as soon as
+    the steps it requires are finished and its resources are free:
+    the location setup on the smartphones runs while the tunnels are established,
+    the tunnels and network checks of both routers run at the same time.
+    Each step claims the routers it acts on, a step that uses ssh_worker also claims worker.
+    A kept tunnel of the session is not set up again.
+    The executed schedule is printed as timeline at the end of the experiment.
+    '''
+    timeline = steps.Timeline(label)
+    timeline_file = config['general'].get('timeline', '')
+    scheduler = steps.Scheduler(timeline)
+    scheduler.add(steps.Step('worker', check_worker, (ssh_worker, prober), [], ['worker']))
+    scheduler.add(steps.Step('network_setup', session.start, (hostnames,), ['worker'],
+                             ['router1', 'router2', 'worker']))
+    scheduler.add(steps.Step('location', location_setup,
+                             (config, countries, hostnames, coordinates, counter,
+                              storage_directory), [], ['phones']))
+    scheduler.add(steps.Step('tunnel_1', wait_tunnel, (session, prober, 0, scheduler.aborted),
+                             ['network_setup'], ['router1']))
+    scheduler.add(steps.Step('tunnel_2', wait_tunnel, (session, prober, 1, scheduler.aborted),
+                             ['network_setup'], ['router2', 'worker']))
+    scheduler.add(steps.Step('network_check_1', network_check, (session, 0), ['tunnel_1'],
+                             ['router1']))
+    scheduler.add(steps.Step('network_check_2', network_check, (session, 1), ['tunnel_2'],
+                             ['router2', 'worker']))
     try:
-        subprocess.check_call(command, shell=True)
-    except Exception as error:
-        print(error)
-        clean_up([], [setup_network_2])
-        force_stop(config, ssh_worker)
-        raise Host1Exception('Host1 does not work')
-
-    command = config['network_check_2']['command']
-    check_2 = ssh_worker.get_transport().open_session()
-    check_2.get_pty()
-    check_2.exec_command(command)
-    if check_2.recv_exit_status() != 0:
-        clean_up([setup_network_1], [])
-        force_stop(config, ssh_worker)
-        raise Host2Exception('Host2 does not work')
+        scheduler.run()
+    except (Host1Exception, Host2Exception):
+        timeline.emit(timeline_file)
+        session.stop()
+        raise
+    except FatalException:
+        timeline.emit(timeline_file)
+        raise
+    setup_network_1, setup_network_2 = session.networks
+    ssh_worker = session.ssh_worker
+    analyses = AnalysisQueue(max_pending, timeline)
 
     '''
     The following loop gets executed for each application measured and listed in this .ini file
     '''
     applications = config['general']['applications'].split(', ')
     for app in applications:
+        #A failed analysis of a previous application ends the experiment as before
+        failed = analyses.failed_apps()
+        if len(failed) != 0:
+            analyses.join()
+            session.stop()
+            raise SmallException('The analysis of ' + ', '.join(failed) + ' in step ' + counter +
+                                 ' failed.')
+
         #Check if the tunnels are still working
         if setup_network_1.poll() is not None:
             print('test2')
-            clean_up([], [setup_network_2])
-            force_stop(config, ssh_worker)
+            analyses.join()
+            session.stop()
             raise Host1Exception('Host1 does not work')
         elif setup_network_2.exit_status_ready():
             print('test3')
-            clean_up([setup_network_1], [])
-            force_stop(config, ssh_worker)
+            analyses.join()
+            session.stop()
             raise Host2Exception('Host2 does not work')
 
         '''
@@ -238,6 +639,7 @@ def experiment(countries, hostnames, coordinates, counter, storage_directory):
         result_2 = counter + '_2_' + app + '_' +countries[1] + '_' + hostnames[1] +'_tcpdump_to_'
         result_2 = result_2 + countries[0] + '_' + hostnames[0] + '_' + timestamp+'.dump'
 
+        capture_start = time.time()
         command = config['measurement_setup_1']['command'] + ' '+ storage_directory + app + '/'
         command = command + result_1
         setup_measurement_1 = subprocess.Popen(command,
@@ -251,20 +653,44 @@ def experiment(countries, hostnames, coordinates, counter, storage_directory):
         setup_measurement_2.get_pty()
         setup_measurement_2.exec_command(command)
 
-        time.sleep(2)
+        #tcpdump is ready when it printed "listening on"
+        try:
+            prober.wait('tcpdump_1',
+                        probes.OutputWatcher(setup_measurement_1.stderr, 'listening on').check,
+                        'tcpdump_deadline', '30', lambda: setup_measurement_1.poll() is not None)
+            prober.wait('tcpdump_2', probes.ChannelWatcher(setup_measurement_2, 'listening on').check,
+                        'tcpdump_deadline', '30', setup_measurement_2.exit_status_ready)
+        except probes.ProbeException as error:
+            print(error)
 
         #Check if both are running
         if setup_measurement_1.poll() is not None:
             print('test4')
-            clean_up([setup_network_1], [setup_network_2, setup_measurement_2])
-            force_stop(config, ssh_worker)
+            clean_up([], [setup_measurement_2])
+            analyses.join()
+            session.stop()
             raise Host1Exception('tcpdump problem on host 1 in step '+ counter)
         elif setup_measurement_2.exit_status_ready():
             print('test5')
-            clean_up([setup_measurement_1, setup_network_1], [setup_network_2])
-            force_stop(config, ssh_worker)
+            clean_up([setup_measurement_1], [])
+            analyses.join()
+            session.stop()
             raise SmallException('tcpdump problem on host 1 in step '+ counter)
 
+        '''
+        In online mode the analysis scripts follow the growing .dump files,
+        the path measurements run already during the application execution.
+        '''
+        directory = storage_directory + app + '/'
+        analyses_1 = []
+        analyses_2 = []
+        if online:
+            analysis_1, analysis_2 = start_analysis(config, ssh_worker, directory,
+                                                    [result_1, result_2], countries, hostnames,
+                                                    app, counter, True)
+            analyses_1 = [analysis_1]
+            analyses_2 = [analysis_2]
+
         '''
         The application execution is recorded again.
         New filenames are created.
@@ -280,8 +706,10 @@ def experiment(countries, hostnames, coordinates, counter, storage_directory):
         video = video_file1 + ' ' + video_file2
 
         command = config['app_execution']['command'] + ' ' + app + ' ' +  video
+        app_start = time.time()
         try:
             subprocess.check_call(command, shell=True)
+            timeline.record('app_' + app, app_start, time.time(), 'done', ['phones'])
         except Exception as error:
             '''
             If the application execution raises an Exception,
@@ -295,72 +723,79 @@ def experiment(countries, hostnames, coordinates, counter, storage_directory):
                 '''
                 If the clean up failes the controller terminates and raises a Fatal exception
                 '''
-                clean_up([setup_network_1, setup_measurement_1],
-                         [setup_network_2, setup_measurement_2])
-                force_stop(config, ssh_worker)
+                clean_up([setup_measurement_1] + analyses_1,
+                         [setup_measurement_2] + analyses_2)
+                analyses.stop()
+                session.stop()
                 raise FatalException('The smarphones completely do not work')
-            clean_up([setup_network_1, setup_measurement_1],
-                     [setup_network_2, setup_measurement_2])
-            force_stop(config, ssh_worker)
+            clean_up([setup_measurement_1] + analyses_1,
+                     [setup_measurement_2] + analyses_2)
+            analyses.join()
+            session.stop()
             raise SmallException('The smartphones do not work: ' + str(error))
 
         '''
         After the application execution, both interception programms get terminated
         and the analysis scripts on both routers started.
+        Both tcpdumps have to be ended before the .dump files are analysed to the end,
+        otherwise the last packets are missing.
+        In online mode the running analysis scripts are told that the .dump files are complete.
+        The analysis is handed to the queue, the next application starts right away
+        if the analysis is pipelined.
         '''
-        clean_up([setup_measurement_1], [setup_measurement_2])
-
-        command = config['analysis_1']['command'] + ' ' +storage_directory  + app + '/' + ' '
-        command = command + result_1 + ' ' + countries[0]+ ' ' +hostnames[0] + ' ' + app + ' '
-        command = command + counter
-
-        analysis_1 = subprocess.Popen(command,
-                                      shell=True,
-                                      stderr=subprocess.PIPE,
-                                      preexec_fn=os.setsid)
-
-        command = config['analysis_2']['command']+ ' ' + storage_directory + app + '/' +  ' '
-        command = command + result_2 + ' ' + countries[1] + ' ' +hostnames[1] + ' ' + app + ' '
-        command = command + counter
-        analysis_2 = ssh_worker.get_transport().open_session()
-        analysis_2.get_pty()
-        analysis_2.exec_command(command)
-
-        analysis_1.communicate()
-        if analysis_1.poll() != 0:
-            clean_up([setup_network_1], [setup_network_2])
-            force_stop(config, ssh_worker)
-            raise SmallException('The analysis of step '+ counter+ ' failed.')
-
-        if analysis_2.recv_exit_status() != 0:
-            clean_up([setup_network_1], [setup_network_2])
-            force_stop(config, ssh_worker)
-            raise SmallException('The analysis of step '+ counter+ ' failed.')
-
-    '''
-    The results get copied to a more reliable storage server.
-    '''
-    command = config['save_1']['command']
+        clean_up([setup_measurement_1], [])
+        setup_measurement_1.wait()
+        if not stop_remote(setup_measurement_2):
+            print('tcpdump on router 2 did not end in time in step ' + counter)
+        timeline.record('capture_' + app, capture_start, time.time(), 'done',
+                        ['router1', 'router2'])
+
+        if online:
+            if not mark_done(ssh_worker, directory, [result_1, result_2]):
+                clean_up([], [analysis_2])
+                analyses.join()
+                session.stop()
+                raise SmallException('The done marker on router 2 could not be created in step ' +
+                                     counter)
+        else:
+            analysis_1, analysis_2 = start_analysis(config, ssh_worker, directory,
+                                                    [result_1, result_2], countries, hostnames,
+                                                    app, counter)
+
+        analyses.add(app, analysis_1, analysis_2)
+
+    '''
+    All analyses have to be finished before the results get copied.
+    '''
+    failed = analyses.join()
+    if len(failed) != 0:
+        session.stop()
+        raise SmallException('The analysis of ' + ', '.join(failed) + ' in step ' + counter +
+                             ' failed.')
+
+    '''
+    The results of both routers get copied to a more reliable storage server at the same time.
+    '''
+    scheduler = steps.Scheduler(timeline)
+    scheduler.add(steps.Step('save_1', save, (config, ssh_worker, 0, counter), [], ['router1']))
+    scheduler.add(steps.Step('save_2', save, (config, ssh_worker, 1, counter), [],
+                             ['router2', 'worker']))
     try:
-        subprocess.check_call(command, shell=True)
-    except:
-        clean_up([setup_network_1], [setup_network_2])
-        force_stop(config, ssh_worker)
-        raise SmallException('Mob2 could not copy to the server on step ' + counter)
-
-    command = config['save_2']['command']
-    try:
-        ssh_worker.exec_command(command)
-    except:
-        clean_up([setup_network_1], [setup_network_2])
-        force_stop(config, ssh_worker)
-        raise SmallException('Mob1 could not copy to the server on step ' + counter)
+        scheduler.run()
+    except SmallException:
+        timeline.emit(timeline_file)
+        session.stop()
+        raise
+    timeline.emit(timeline_file)
 
     '''
     At the end, the network setup gets closed.
+    The tunnels of a session stay up with keep_tunnels, the next experiment may use them.
     '''
-    clean_up([setup_network_1], [setup_network_2])
-    force_stop(config, ssh_worker)
+    if own_session:
+        session.close()
+    else:
+        session.release()
 
 def main():
 
@@ -0,0 +1,179 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Readiness probes of the controller.
+Instead of sleeping a fixed time, the controller polls the condition it waits for,
+e.g. the tun device is up, a DNS query through the tunnel succeeds or tcpdump listens.
+Each probe has its own deadline, the time between two checks grows with a backoff factor.
+The waiting times are printed and optionally appended to a log file.
+'''
+import re
+import subprocess
+import threading
+import time
+
+class ProbeException(Exception):
+    '''
+    Exception if a probe did not pass before its deadline or the awaited process ended
+    '''
+    def __init__(self, value):
+        self.value = value
+    def __str__(self):
+        return repr(self.value)
+
+def command_check(command, timeout=10):
+    '''
+    returns a check that passes if the local shell command returns 0
+    '''
+    def check():
+        try:
+            subprocess.check_call(command, shell=True, timeout=timeout,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            return False
+        return True
+    return check
+
+def remote_check(ssh, command, timeout=10):
+    '''
+    returns a check that passes if the shell command returns 0 on the remote host of the ssh client
+    '''
+    def check():
+        try:
+            stdin, stdout, stderr = ssh.exec_command(command, timeout=timeout)
+            return stdout.channel.recv_exit_status() == 0
+        except Exception:
+            return False
+    return check
+
+class OutputWatcher():
+    '''
+    Reads the output of a local process in a thread and remembers if a line matched the pattern,
+    e.g. "listening on" of tcpdump. The output is read until the process closes it.
+    '''
+    def __init__(self, stream, pattern):
+        self.pattern = re.compile(pattern)
+        self.matched = threading.Event()
+        self.thread = threading.Thread(target=self.read, args=(stream,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def read(self, stream):
+        for line in iter(stream.readline, b''):
+            if self.pattern.search(line.decode('utf-8', 'replace')):
+                self.matched.set()
+
+    def check(self):
+        return self.matched.is_set()
+
+class ChannelWatcher():
+    '''
+    Reads the available output of a Paramiko channel (with a pty stdout and stderr are combined)
+    on each check and passes as soon as the pattern appeared.
+    '''
+    def __init__(self, channel, pattern):
+        self.channel = channel
+        self.pattern = re.compile(pattern)
+        self.output = ''
+        self.matched = False
+
+    def check(self):
+        while not self.matched and self.channel.recv_ready():
+            self.output = self.output[-4096:] + self.channel.recv(4096).decode('utf-8', 'replace')
+            self.matched = self.pattern.search(self.output) is not None
+        return self.matched
+
+class Probe():
+    '''
+    Polls check() until it returns True.
+    The first check is made immediately, afterwards the interval is multiplied with the backoff
+    up to max_interval. If abort() returns True, e.g. because the awaited process ended,
+    or the deadline in seconds passed, a ProbeException is raised.
+    '''
+    def __init__(self, name, check, deadline, interval=1.0, backoff=1.5, max_interval=10.0,
+                 abort=None):
+        self.name = name
+        self.check = check
+        self.deadline = float(deadline)
+        self.interval = float(interval)
+        self.backoff = float(backoff)
+        self.max_interval = float(max_interval)
+        self.abort = abort
+
+    def wait(self):
+        '''
+        returns the seconds waited until the probe passed
+        '''
+        started = time.time()
+        interval = self.interval
+        while True:
+            if self.check():
+                return time.time() - started
+            if self.abort is not None and self.abort():
+                raise ProbeException(self.name + ' failed, the process ended after %.1f s' %
+                                     (time.time() - started))
+            remaining = started + self.deadline - time.time()
+            if remaining <= 0:
+                raise ProbeException(self.name + ' did not pass within %g s' % self.deadline)
+            time.sleep(min(interval, remaining))
+            interval = min(interval * self.backoff, self.max_interval)
+
+class Prober():
+    '''
+    Creates the probes with the deadlines and the backoff of the probes section of the controller.ini
+    and logs their waiting times.
+    '''
+    def __init__(self, config, label=''):
+        self.section = {}
+        if config.has_section('probes'):
+            self.section = config['probes']
+        self.label = label
+        self.log = self.section.get('log', '')
+        self.waited = []
+
+    def option(self, option, default):
+        '''
+        returns an option of the probes section or the default value if it is missing
+        '''
+        return self.section.get(option, default)
+
+    def wait(self, name, check, deadline_option, default_deadline, abort=None):
+        '''
+        Waits for a probe and logs the waiting time,
+        the ProbeException of a failed probe is logged and raised again
+        '''
+        probe = Probe(name, check, self.option(deadline_option, default_deadline),
+                      self.option('interval', '1'), self.option('backoff', '1.5'),
+                      self.option('max_interval', '10'), abort)
+        started = time.time()
+        try:
+            waited = probe.wait()
+        except ProbeException:
+            self.record(name, time.time() - started, 'failed')
+            raise
+        self.record(name, waited, 'passed')
+        return waited
+
+    def record(self, name, seconds, status):
+        '''
+        Prints the waiting time of a probe and appends it to the log file
+        '''
+        self.waited = self.waited + [(name, seconds, status)]
+        print('Probe ' + name + ' ' + status + ' after %.1f s' % seconds)
+        if self.log != '':
+            f = open(self.log, 'a')
+            f.write('\t'.join([time.strftime('%Y_%m_%d_%H:%M:%S'), self.label, name,
+                               '%.2f' % seconds, status]) + '\n')
+            f.close()
@@ -0,0 +1,168 @@
+'''
+Copyright 2015 Johannes Zirngibl
+
+This file is part of MATAdOR.
+
+MATAdOR is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+MATAdOR is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+Dependency graph of the steps of an experiment.
+Each step names the steps it requires and the resources it uses exclusively,
+e.g. router1, router2, phones or worker (the SSH connection to the second router).
+A step claims every router it acts on, a step that uses the SSH connection to the second router
+claims worker in addition, e.g. the backup of the second router claims router2 and worker.
+The scheduler starts every step whose required steps are finished and whose resources are free,
+each step in its own thread. If a step fails, no further step is started,
+the running steps are finished and the exception of the failed step is raised.
+The executed schedule is recorded in a timeline.
+'''
+import threading
+import time
+
+class Step():
+    '''
+    A step calls function(*args), its return value is kept as result of the step
+    '''
+    def __init__(self, name, function, args=(), requires=None, resources=None):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.requires = requires or []
+        self.resources = resources or []
+
+class Timeline():
+    '''
+    Start, end and status of the steps of an experiment, relative to the creation of the timeline
+    '''
+    def __init__(self, label=''):
+        self.label = label
+        self.started = time.time()
+        self.entries = []
+        self.lock = threading.Lock()
+
+    def record(self, name, start, end, status, resources=None):
+        '''
+        Adds a step with its start and end time (time.time())
+        '''
+        with self.lock:
+            self.entries = self.entries + [(start - self.started, end - self.started, name, status,
+                                            resources or [])]
+
+    def lines(self):
+        '''
+        returns the recorded steps ordered by their start, one line per step
+        '''
+        with self.lock:
+            entries = sorted(self.entries)
+        lines = []
+        for start, end, name, status, resources in entries:
+            lines = lines + ['%-24s %8.1f %8.1f %8.1f  %-8s %s' %
+                             (name, start, end, end - start, status, ','.join(resources))]
+        return lines
+
+    def emit(self, filename=''):
+        '''
+        Prints the timeline and appends it to the file, if one is given
+        '''
+        print('%-24s %8s %8s %8s  %-8s %s' % ('step', 'start', 'end', 'seconds', 'status',
+                                              'resources'))
+        for line in self.lines():
+            print(line)
+        if filename != '':
+            with self.lock:
+                entries = sorted(self.entries)
+            f = open(filename, 'a')
+            for start, end, name, status, resources in entries:
+                f.write('\t'.join([time.strftime('%Y_%m_%d_%H:%M:%S',
+                                                 time.localtime(self.started)),
+                                   self.label, name, '%.2f' % start, '%.2f' % end, status,
+                                   ','.join(resources)]) + '\n')
+            f.close()
+
+class Scheduler():
+    '''
+    Runs the added steps according to their dependencies and resources
+    '''
+    def __init__(self, timeline):
+        self.timeline = timeline
+        self.steps = []
+        self.results = {}
+        self.error = None
+        self.condition = threading.Condition()
+
+    def add(self, step):
+        '''
+        Adds a step, the steps it requires have to be added before
+        '''
+        names = [added.name for added in self.steps]
+        for required in step.requires:
+            if required not in names:
+                raise ValueError('Step ' + step.name + ' requires the unknown step ' + required)
+        self.steps = self.steps + [step]
+
+    def aborted(self):
+        '''
+        returns True if a step failed, long running steps can use it to stop early
+        '''
+        return self.error is not None
+
+    def execute(self, step, busy, running):
+        '''
+        Runs one step in its thread and releases its resources afterwards
+        '''
+        start = time.time()
+        try:
+            result = step.function(*step.args)
+        except Exception as error:
+            self.timeline.record(step.name, start, time.time(), 'failed', step.resources)
+            with self.condition:
+                if self.error is None:
+                    self.error = error
+                running.remove(step.name)
+                for resource in step.resources:
+                    busy.remove(resource)
+                self.condition.notify()
+            return
+        self.timeline.record(step.name, start, time.time(), 'done', step.resources)
+        with self.condition:
+            self.results[step.name] = result
+            running.remove(step.name)
+            for resource in step.resources:
+                busy.remove(resource)
+            self.condition.notify()
+
+    def run(self):
+        '''
+        Runs all steps and returns their results as dictionary by name.
+        The exception of the first failed step is raised after the running steps finished.
+        '''
+        pending = list(self.steps)
+        running = set()
+        busy = set()
+        with self.condition:
+            while True:
+                if self.error is None:
+                    for step in list(pending):
+                        ready = all([required in self.results for required in step.requires])
+                        free = all([resource not in busy for resource in step.resources])
+                        if ready and free:
+                            pending.remove(step)
+                            running.add(step.name)
+                            busy.update(step.resources)
+                            thread = threading.Thread(target=self.execute,
+                                                      args=(step, busy, running))
+                            thread.daemon = True
+                            thread.start()
+                if len(running) == 0:
+                    break
+                self.condition.wait()
+        if self.error is not None:
+            raise self.error
+        return self.results
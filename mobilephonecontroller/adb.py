@@ -20,6 +20,7 @@ Combination of all necessary functions for the smartphone controller.
 import subprocess
 import time
 import configparser
+import json
 import os
 import sys
 import signal
@@ -265,7 +266,89 @@ class adb():
         waittime = self.config[app]['waittime']
         time.sleep(int(waittime))
 
-    def xprivacy_set_fake_location(self, list_of_coordinates):
+    def boot_id(self, device):
+        '''
+        returns the boot id of a device, a new one is created on every boot,
+        or None if it can not be read
+        '''
+        command = 'adb -s {0} shell cat /proc/sys/kernel/random/boot_id'.format(device)
+        try:
+            return subprocess.check_output(command, shell=True).decode('utf-8').strip()
+        except subprocess.CalledProcessError:
+            return None
+
+    def xprivacy_devices(self, list_of_coordinates):
+        '''
+        returns the devices with XPrivacy support and their coordinates as list of pairs,
+        the coordinates are assigned to these devices in the given order
+        '''
+        #The xprivacy support is optional
+        devices_with_xprivacy_support = [device for device in self.devices
+                                         if self.config[device].getboolean('xprivacy')]
+        return list(zip(devices_with_xprivacy_support, list_of_coordinates))
+
+    def xprivacy_state_file(self):
+        '''
+        returns the file with the last imported coordinates of each device
+        or an empty string if the coordinates are imported every time
+        '''
+        state_file = self.config['xprivacy'].get('state_file', '')
+        if state_file != '' and not os.path.isabs(state_file):
+            state_file = self.direc + state_file
+        return state_file
+
+    def xprivacy_load_state(self):
+        '''
+        returns the stored state {device: {'coordinates': [...], 'boot_id': ...}},
+        a missing or damaged file is an empty state
+        '''
+        state_file = self.xprivacy_state_file()
+        if state_file == '' or not os.path.exists(state_file):
+            return {}
+        file = open(state_file)
+        try:
+            state = json.load(file)
+        except ValueError:
+            state = {}
+        file.close()
+        return state
+
+    def xprivacy_outdated(self, list_of_coordinates):
+        '''
+        returns the devices whose coordinates have to be imported.
+        The coordinates of a device are up to date if they were imported last time
+        and the device was not rebooted since then (same boot id).
+        Without a state file all devices with XPrivacy support are returned.
+        '''
+        pairs = self.xprivacy_devices(list_of_coordinates)
+        if self.xprivacy_state_file() == '':
+            return [device for device, coords in pairs]
+        state = self.xprivacy_load_state()
+        outdated = []
+        for device, coords in pairs:
+            stored = state.get(device)
+            if (stored is None or stored.get('coordinates') != [str(value) for value in coords] or
+                    stored.get('boot_id') is None or stored.get('boot_id') != self.boot_id(device)):
+                outdated = outdated + [device]
+        return outdated
+
+    def xprivacy_save_state(self, pairs):
+        '''
+        Stores the imported coordinates and the current boot id of the devices
+        '''
+        state_file = self.xprivacy_state_file()
+        if state_file == '':
+            return
+        state = self.xprivacy_load_state()
+        for device, coords in pairs:
+            state[device] = {'coordinates': [str(value) for value in coords],
+                             'boot_id': self.boot_id(device)}
+        file = open(state_file + '.tmp', 'w')
+        json.dump(state, file, sort_keys=True)
+        file.close()
+        os.rename(state_file + '.tmp', state_file)
+
+    def xprivacy_set_fake_location(self, list_of_coordinates, devices=None):
         '''
         The XPrivacy Pro version supports Exporting and Importing configutations as an xml file.
         There are actvies for both functions.
@@ -274,6 +357,7 @@ class adb():
         Therefore this method copies the xml file
         everytime with the same name to the same directory.
         This has to be done unfortunately once by hand before.
+        Only the given devices are changed, by default all devices with XPrivacy support.
         Steps:
             1. Create the XML file with the new longitutde and latitude
             2. Push it to all devices
@@ -288,17 +372,16 @@ class adb():
         fileCoordinates = self.config['xprivacy']['fileCoordinates']
         okCoordinates = self.config['xprivacy']['okCoordinates']
 
-        #The xprivacy support is optional
-        devices_with_xprivacy_support = [device for device in self.devices
-                                         if self.config[device].getboolean('xprivacy')]
+        pairs = [(device, coords) for device, coords in self.xprivacy_devices(list_of_coordinates)
+                 if devices is None or device in devices]
+        devices_with_xprivacy_support = [device for device, coords in pairs]
         if len(devices_with_xprivacy_support) != 0:
-            for device in devices_with_xprivacy_support:
+            for device, coords in pairs:
                 '''
                 The config xml has to holds only the values that want to be changed.
                 Therefore this creates the minimal file possible
                 '''
                 #Step1
-                coords = list_of_coordinates.pop(0)
                 file = open('xprivacy_coordinates.xml', 'w')
                 file.write('<XPrivacy>')
                 file.write('<Setting Id="" Type="" Name="Latitude" Value="'+str(coords[0]) + '" />')
@@ -342,6 +425,9 @@ class adb():
                 command = 'adb -s {0} shell am force-stop biz.bokhorst.xprivacy'.format(device)
                 subprocess.check_call(command, shell=True)
 
+            #The next experiment skips the devices that keep their coordinates
+            self.xprivacy_save_state(pairs)
+
     def firewall_set_up(self):
         '''
         Set up firewall:
@@ -27,6 +27,9 @@ def main():
     3. a video file name for the first coordinate pair
     4. a video file name for the second coordinate pair
 
+    Devices that already have the coordinates from the previous experiment are skipped,
+    if no device needs new coordinates nothing is done (see state_file in the adb.ini).
+
     Steps:
     1. the screen records get sarted
     2. the screens of the smartphones get activated
@@ -48,12 +51,16 @@ def main():
     co2 = sys.argv[2].split(',')
     video_names = [sys.argv[3], sys.argv[4]]
     smartphone_control = adb.adb()
+    outdated = smartphone_control.xprivacy_outdated([co1, co2])
+    if len(outdated) == 0:
+        print('The smartphones already use the coordinates, nothing is imported')
+        return
     #Step 1
     pid_list = smartphone_control.start_screencast()
     #Step 2
     smartphone_control.activate_screen()
     #Step 3
-    smartphone_control.xprivacy_set_fake_location([co1, co2])
+    smartphone_control.xprivacy_set_fake_location([co1, co2], outdated)
     #Step 4
     smartphone_control.sleep()
     #Step 5
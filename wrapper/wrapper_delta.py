@@ -187,6 +187,13 @@ def execute():
 
     write_log(logfile, 'Successfull initialization')
 
+    '''
+    The session holds the connection to the second router and the tunnels of the experiments.
+    The first hostname stays the same for a whole row of the matrix,
+    its tunnel is kept (keep_tunnels in the controller.ini) and only the second one replaced.
+    '''
+    session = controller.Session()
+
     '''
     Iterate through all possible country pairs.
     Because of the fluctuation in the planet lab uptimes n iterations are done.
@@ -231,7 +238,8 @@ def execute():
                                                   [longitude1+','+latitude1,
                                                    longitude2+','+latitude2],
                                                   str(counter).zfill(4),
-                                                  storage_directory)
+                                                  storage_directory,
+                                                  session)
                             matrix[i][j] = 3
                             matrix[j][i] = 3
                             counter = counter + 1
@@ -298,6 +306,10 @@ def execute():
                             message = 'ERROR: A fatal exception has occured: '+ str(error)
                             message = message + '\n The measurement was terminated'
                             write_log(logfile, message)
+                            try:
+                                session.close()
+                            except controller.FatalException:
+                                pass
                             sys.exit(3)
 
                         except controller.SmallException as error:
@@ -355,6 +367,7 @@ def execute():
 
         i = i+1
 
+    session.close()
     write_log(logfile, 'All possible pairs were tried and  they were neither successfull or failed')
 
     '''